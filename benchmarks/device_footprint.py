@@ -0,0 +1,93 @@
+# Reports the resident memory and startup time of N DummyPlugin devices, each
+# with its own TCP server, as created by jemo.device.create_devices. Every size
+# is measured in a fresh process.
+#
+# Usage: poetry run python benchmarks/device_footprint.py [-s 10 100 1000]
+import argparse
+import os
+import resource
+import subprocess
+import sys
+import time
+
+SRC_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+sys.path.insert(0, SRC_PATH)
+
+
+def rss_kib() -> int:
+    with open("/proc/self/status", encoding="utf8") as status:
+        for line in status:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1])
+    # Not Linux, fall back to the peak
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def measure(size: int, base_port: int):
+    # pylint:disable=import-outside-toplevel
+    from PyQt6.QtWidgets import QApplication
+
+    from jemo import logger
+    from jemo.device import create_devices
+    from jemo.device_table import DeviceTable
+    from jemo.jemo import SSDPServer
+    from jemo.utils import LocalAddress
+
+    logger.setLevel("ERROR")
+    # Each device holds a listening socket
+    _, hard_limit = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (hard_limit, hard_limit))
+
+    application = QApplication(sys.argv)
+    device_configs = [
+        ("DummyPlugin", {}, {"name": f"Device {i}", "port": base_port + i})
+        for i in range(size)
+    ]
+    device_table = DeviceTable()
+    ssdp_server = SSDPServer([LocalAddress("lo", 1, "127.0.0.1", 8)], device_table)
+
+    rss_before = rss_kib()
+    started = time.perf_counter()
+    jemo_devices = create_devices(
+        device_configs, ["127.0.0.1"], device_table=device_table
+    )
+    application.processEvents()
+    elapsed = time.perf_counter() - started
+    rss_after = rss_kib()
+
+    assert len(jemo_devices) == len(device_table) == size
+    print(f"{size} {rss_before} {rss_after} {elapsed}")
+
+
+def run(sizes, base_port: int):
+    print(
+        f"{'devices':>8}{'RSS (MiB)':>12}{'devices (MiB)':>15}"
+        f"{'per device (KiB)':>18}{'startup (ms)':>14}"
+    )
+    for size in sizes:
+        output = subprocess.run(
+            [sys.executable, __file__, "--child", str(size), "-p", str(base_port)],
+            check=True,
+            capture_output=True,
+            text=True,
+            env={**os.environ, "QT_QPA_PLATFORM": "offscreen"},
+        ).stdout.split()
+        _, rss_before, rss_after, elapsed = output[-4:]
+        delta = int(rss_after) - int(rss_before)
+        print(
+            f"{size:>8}{int(rss_after) / 1024:>12.1f}{delta / 1024:>15.1f}"
+            f"{delta / size:>18.1f}{float(elapsed) * 1000:>14.1f}"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Device footprint benchmark")
+    parser.add_argument("-s", "--sizes", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("-p", "--base-port", type=int, default=20000)
+    parser.add_argument("--child", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        measure(args.child, args.base_port)
+    else:
+        run(args.sizes, args.base_port)
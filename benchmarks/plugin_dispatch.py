@@ -0,0 +1,80 @@
+# Compares attribute access and on/off dispatch between the explicit
+# PluginBase.perform() dispatcher and the previous __getattribute__ based
+# interception, which is reproduced here as LegacyDummyPlugin.
+#
+# Usage: poetry run python benchmarks/plugin_dispatch.py [-n NUMBER]
+import argparse
+import os
+import sys
+import timeit
+from typing import Callable
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from jemo.plugins import DummyPlugin  # noqa: E402 pylint:disable=wrong-import-position
+
+
+class LegacyDummyPlugin:
+    def __init__(self, *, name: str, port: int) -> None:
+        self._name = name
+        self._port = port
+        self._latest_action = "off"
+
+    def __getattribute__(self, name: str) -> Callable:
+        if name in ("on", "off"):
+            success = object.__getattribute__(self, name)()
+            if success is True:
+                self._latest_action = name
+            return lambda: success
+        return object.__getattribute__(self, name)
+
+    @property
+    def port(self) -> int:
+        return self._port
+
+    @property
+    def name(self) -> str:
+        return self._name
+
+    def on(self) -> bool:  # pylint:disable=invalid-name
+        return True
+
+    def off(self) -> bool:
+        return True
+
+    def get_state(self) -> str:
+        return self._latest_action
+
+
+def run(number: int):
+    legacy = LegacyDummyPlugin(name="Legacy", port=0)
+    plugin = DummyPlugin(name="Dispatch", port=0)
+
+    cases = [
+        ("attribute: _name", "p._name", "p._name"),
+        ("property: port", "p.port", "p.port"),
+        ("lookup: get_state", "p.get_state", "p.get_state"),
+        ("call: get_state()", "p.get_state()", "p.get_state()"),
+        ("action: on", "p.on()", "p.perform('on')"),
+    ]
+
+    print(f"{'case':<22}{'legacy (ns)':>14}{'perform (ns)':>14}{'speedup':>10}")
+    for label, legacy_stmt, stmt in cases:
+        legacy_time = min(
+            timeit.repeat(legacy_stmt, globals={"p": legacy}, number=number, repeat=5)
+        )
+        new_time = min(
+            timeit.repeat(stmt, globals={"p": plugin}, number=number, repeat=5)
+        )
+        print(
+            f"{label:<22}{legacy_time / number * 1e9:>14.1f}"
+            f"{new_time / number * 1e9:>14.1f}{legacy_time / new_time:>9.2f}x"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="PluginBase dispatch benchmark")
+    parser.add_argument("-n", "--number", type=int, default=200_000)
+    args = parser.parse_args()
+
+    run(args.number)
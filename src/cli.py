@@ -1,9 +1,13 @@
 import argparse
+import multiprocessing
 
 from jemo import logger
 from jemo.jemo import main
 
 if __name__ == "__main__":
+    # Required for supervisor mode worker processes in frozen executables
+    multiprocessing.freeze_support()
+
     parser = argparse.ArgumentParser(
         description="Emulate Belkin WeMo devices for use with Amazon Echo"
     )
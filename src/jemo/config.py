@@ -1,5 +1,10 @@
+from typing import Any, Dict, Tuple
+
 from yaml import Loader, load
 
+# (plugin class name, plugin level vars, device config)
+DeviceConfig = Tuple[str, Dict[str, Any], Dict[str, Any]]
+
 
 def load_config_file(config_file_path: str) -> dict:
     with open(config_file_path, "r", encoding="utf8") as config_file:
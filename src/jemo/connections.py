@@ -0,0 +1,127 @@
+import time
+from typing import TYPE_CHECKING, Set
+
+from PyQt6.QtCore import QObject, QTimer, pyqtSlot
+
+from . import logger
+
+if TYPE_CHECKING:
+    from .device import JemoDevice
+
+
+class ConnectionInfo:  # pylint:disable=too-few-public-methods
+    __slots__ = ("connected_at", "last_activity", "header_received", "_tail")
+
+    def __init__(self) -> None:
+        self.connected_at = self.last_activity = time.monotonic()
+        self.header_received = False
+        self._tail = b""
+
+    def received(self, data: bytes) -> None:
+        self.last_activity = time.monotonic()
+        if not self.header_received:
+            # The end of the header may be split across reads
+            data = self._tail + data
+            self.header_received = b"\r\n\r\n" in data
+            self._tail = data[-3:]
+
+
+class ConnectionTracker(QObject):  # pylint:disable=too-many-instance-attributes
+    # Shared by all the JemoDevices in a process. When a limit is reached the
+    # affected TCP servers stop accepting, leaving new connections queued in
+    # the listen backlog until a slot frees up (any already accepted by Qt
+    # beyond the limit are refused), and a single sweep timer aborts
+    # connections that never send a request or sit idle.
+    def __init__(
+        self,
+        *,
+        max_connections: int = 0,
+        max_connections_per_device: int = 0,
+        header_timeout: float = 10,
+        idle_timeout: float = 60,
+        sweep_interval: float = 1,
+        parent=None,
+        **kwargs,
+    ):  # pylint:disable=too-many-arguments
+        super().__init__(parent, **kwargs)
+        self._max_connections = max_connections
+        self._max_connections_per_device = max_connections_per_device
+        self._header_timeout = header_timeout
+        self._idle_timeout = idle_timeout
+
+        self._devices: Set["JemoDevice"] = set()
+        self._total = 0
+        self._paused = False
+
+        self._sweep_timer = QTimer(self, timeout=self.sweep)  # type:ignore
+        self._sweep_timer.start(int(sweep_interval * 1000))
+
+    @property
+    def total(self) -> int:
+        return self._total
+
+    def register(self, device: "JemoDevice"):
+        self._devices.add(device)
+
+    def can_accept(self, device: "JemoDevice") -> bool:
+        return (
+            not self._max_connections or self._total < self._max_connections
+        ) and self._device_has_capacity(device)
+
+    def connection_opened(self, device: "JemoDevice"):
+        self._total += 1
+        if self._max_connections and self._total >= self._max_connections:
+            if not self._paused:
+                logger.warning(
+                    f"Connection limit ({self._max_connections}) reached, "
+                    "pausing all devices"
+                )
+                self._paused = True
+                for registered_device in self._devices:
+                    registered_device.pause_accepting()
+        elif (
+            self._max_connections_per_device
+            and len(device.connections) >= self._max_connections_per_device
+        ):
+            logger.warning(
+                f"Connection limit ({self._max_connections_per_device}) reached "
+                f"for {device.name}, pausing"
+            )
+            device.pause_accepting()
+
+    def connection_closed(self, device: "JemoDevice"):
+        self._total -= 1
+        if self._paused:
+            if self._total < self._max_connections:
+                self._paused = False
+                for registered_device in self._devices:
+                    if self._device_has_capacity(registered_device):
+                        registered_device.resume_accepting()
+        elif self._device_has_capacity(device):
+            device.resume_accepting()
+
+    def _device_has_capacity(self, device: "JemoDevice") -> bool:
+        return (
+            not self._max_connections_per_device
+            or len(device.connections) < self._max_connections_per_device
+        )
+
+    @pyqtSlot()
+    def sweep(self):
+        now = time.monotonic()
+        for device in self._devices:
+            expired = [
+                socket
+                for socket, info in device.connections.items()
+                if (
+                    not info.header_received
+                    and now - info.connected_at > self._header_timeout
+                )
+                or now - info.last_activity > self._idle_timeout
+            ]
+            for socket in expired:
+                logger.debug(
+                    f"Closing timed out connection to {device.name} from "
+                    f"{socket.peerAddress().toString()}:{socket.peerPort()}"
+                )
+                socket.abort()
@@ -0,0 +1,58 @@
+from typing import Callable, Optional
+
+from PyQt6.QtCore import QObject, QTimer, pyqtSlot
+
+from . import logger
+
+
+class CommandDebouncer(QObject):
+    # Latest-wins queue of desired actions for a single device. An action
+    # submitted while idle runs on the next event loop iteration (i.e. after
+    # the response has been sent) and starts a window during which further
+    # submissions only replace the pending action; whatever is pending when
+    # the window ends is then run. So at most one action reaches the backend
+    # per window and superseded intermediate actions are dropped.
+    def __init__(
+        self,
+        name: str,
+        perform: Callable[[str], bool],
+        *,
+        window: int,
+        parent=None,
+        **kwargs,
+    ):  # pylint:disable=too-many-arguments
+        super().__init__(parent, **kwargs)
+        self._name = name
+        self._perform = perform
+        self._window = window
+        self._pending: Optional[str] = None
+        self._collapsed = 0
+
+        self._timer = QTimer(self, singleShot=True, timeout=self.run)  # type:ignore
+
+    @property
+    def pending(self) -> Optional[str]:
+        return self._pending
+
+    @property
+    def collapsed(self) -> int:
+        return self._collapsed
+
+    def submit(self, action: str):
+        if self._pending is not None:
+            self._collapsed += 1
+            logger.info(
+                f"Dropping superseded '{self._pending}' for {self._name} "
+                f"({self._collapsed} collapsed)"
+            )
+        self._pending = action
+        if not self._timer.isActive():
+            self._timer.start(0)
+
+    @pyqtSlot()
+    def run(self):
+        if self._pending is None:
+            return
+        action, self._pending = self._pending, None
+        self._timer.start(self._window)
+        self._perform(action)
@@ -0,0 +1,579 @@
+import importlib
+import threading
+import time
+from concurrent.futures import Future
+from email.utils import formatdate
+from functools import partial
+from typing import Callable, Dict, List, Mapping, Optional, Sequence
+
+from PyQt6.QtCore import QObject, pyqtSlot
+from PyQt6.QtNetwork import QHostAddress, QTcpServer, QTcpSocket
+from PyQt6.QtWidgets import QApplication
+
+from . import logger
+from .config import DeviceConfig
+from .connections import ConnectionInfo, ConnectionTracker
+from .debounce import CommandDebouncer
+from .device_table import DeviceTable
+from .diagnostics import Diagnostics, spans, timing_span
+from .gena import GENAEventService
+from .management import ManagementServer
+from .plugins import PluginBase
+from .state_store import StateJournal
+from .utils import parse_http_headers
+
+NEW_LINE = "\r\n"
+
+# Response bodies shared by all devices
+SETUP_XML = (
+    '<?xml version="1.0"?>'
+    "<root>"
+    "<specVersion><major>1</major><minor>0</minor></specVersion>"
+    "<device>"
+    "<deviceType>urn:Belkin:device:controllee:1</deviceType>"
+    "<friendlyName>{name}</friendlyName>"
+    "<manufacturer>Belkin International Inc.</manufacturer>"
+    "<modelName>Emulated Socket</modelName>"
+    "<modelNumber>3.1415</modelNumber>"
+    "<UDN>uuid:Socket-1_0-{serial}</UDN>"
+    "<serviceList>"
+    "<service>"
+    "<serviceType>urn:Belkin:service:basicevent:1</serviceType>"
+    "<serviceId>urn:Belkin:serviceId:basicevent1</serviceId>"
+    "<controlURL>/upnp/control/basicevent1</controlURL>"
+    "<eventSubURL>/upnp/event/basicevent1</eventSubURL>"
+    "<SCPDURL>/eventservice.xml</SCPDURL>"
+    "</service>"
+    "<service>"
+    "<serviceType>urn:Belkin:service:metainfo:1</serviceType>"
+    "<serviceId>urn:Belkin:serviceId:metainfo1</serviceId>"
+    "<controlURL>/upnp/control/metainfo1</controlURL>"
+    "<eventSubURL>/upnp/event/metainfo1</eventSubURL>"
+    "<SCPDURL>/metainfoservice.xml</SCPDURL>"
+    "</service>"
+    "</serviceList>"
+    "</device>"
+    "</root>"
+).format
+
+EVENTSERVICE_XML = (
+    '<scpd xmlns="urn:Belkin:service-1-0">'
+    "<actionList>"
+    "<action>"
+    "<name>SetBinaryState</name>"
+    "<argumentList>"
+    "<argument>"
+    "<retval/>"
+    "<name>BinaryState</name>"
+    "<relatedStateVariable>BinaryState</relatedStateVariable>"
+    "<direction>in</direction>"
+    "</argument>"
+    "</argumentList>"
+    "</action>"
+    "<action>"
+    "<name>GetBinaryState</name>"
+    "<argumentList>"
+    "<argument>"
+    "<retval/>"
+    "<name>BinaryState</name>"
+    "<relatedStateVariable>BinaryState</relatedStateVariable>"
+    "<direction>out</direction>"
+    "</argument>"
+    "</argumentList>"
+    "</action>"
+    "</actionList>"
+    "<serviceStateTable>"
+    '<stateVariable sendEvents="yes">'
+    "<name>BinaryState</name>"
+    "<dataType>Boolean</dataType>"
+    "<defaultValue>0</defaultValue>"
+    "</stateVariable>"
+    '<stateVariable sendEvents="yes">'
+    "<name>level</name>"
+    "<dataType>string</dataType>"
+    "<defaultValue>0</defaultValue>"
+    "</stateVariable>"
+    "</serviceStateTable>"
+    "</scpd>"
+) + 2 * NEW_LINE
+
+METAINFOSERVICE_XML = (
+    '<scpd xmlns="urn:Belkin:service-1-0">'
+    "<specVersion>"
+    "<major>1</major>"
+    "<minor>0</minor>"
+    "</specVersion>"
+    "<actionList>"
+    "<action>"
+    "<name>GetMetaInfo</name>"
+    "<argumentList>"
+    "<retval />"
+    "<name>GetMetaInfo</name>"
+    "<relatedStateVariable>MetaInfo</relatedStateVariable>"
+    "<direction>in</direction>"
+    "</argumentList>"
+    "</action>"
+    "</actionList>"
+    "<serviceStateTable>"
+    '<stateVariable sendEvents="yes">'
+    "<name>MetaInfo</name>"
+    "<dataType>string</dataType>"
+    "<defaultValue>0</defaultValue>"
+    "</stateVariable>"
+    "</serviceStateTable>"
+    "</scpd>"
+) + 2 * NEW_LINE
+
+
+class JemoDevice(QObject):  # pylint:disable=too-many-instance-attributes
+    # pylint:disable=too-many-public-methods
+    def __init__(  # pylint:disable=too-many-arguments
+        self,
+        name: str,
+        plugin: PluginBase,
+        *,
+        device_table: DeviceTable,
+        events: Optional[Mapping] = None,
+        state_store: Optional[StateJournal] = None,
+        connections: Optional[ConnectionTracker] = None,
+        debounce_window: int = 0,
+        **kwargs,
+    ) -> None:
+        super().__init__(parent=None, **kwargs)  # type:ignore
+        # The name, serial and port live in a table shared with SSDPServer
+        self._table = device_table
+        self._index = self._table.add(name, plugin.port)
+        self._plugin = plugin
+        self._servers: List[QTcpServer] = []
+        self._sockets: Dict[QTcpSocket, ConnectionInfo] = {}
+        self._connections = connections or ConnectionTracker(parent=self)
+        self._connections.register(self)
+        # Created on the first SUBSCRIBE, most devices never get one
+        self._events: Optional[GENAEventService] = None
+        self._events_config = events
+
+        self._state_store = state_store
+        if self._state_store:
+            entry = self._state_store.get(self.serial)
+            if entry:
+                logger.debug(f"Restoring {name} latest action: {entry}")
+                self._plugin.restore_latest_action(*entry)
+
+        # Serializes plugin calls made from management API threads with those
+        # on the event loop (re-entrant, as plugins may process events)
+        self._plugin_lock = threading.RLock()
+
+        self._debouncer: Optional[CommandDebouncer] = None
+        if debounce_window > 0:
+            self._debouncer = CommandDebouncer(
+                name, self.perform_action, window=debounce_window, parent=self
+            )
+
+    @property
+    def name(self) -> str:
+        return self._table.names[self._index]
+
+    @property
+    def serial(self) -> str:
+        return self._table.serials[self._index]
+
+    @property
+    def port(self) -> int:
+        return self._table.ports[self._index]
+
+    @property
+    def plugin(self) -> PluginBase:
+        return self._plugin
+
+    @property
+    def pending_action(self) -> Optional[str]:
+        return self._debouncer.pending if self._debouncer else None
+
+    @property
+    def debounced(self) -> bool:
+        return self._debouncer is not None
+
+    @property
+    def connections(self) -> Mapping[QTcpSocket, ConnectionInfo]:
+        return self._sockets
+
+    def pause_accepting(self):
+        for server in self._servers:
+            server.pauseAccepting()
+
+    def resume_accepting(self):
+        for server in self._servers:
+            server.resumeAccepting()
+
+    def start_server(self, ip_address: str, port: int):
+        # May be called once per local address the device should be served on
+        logger.debug(f"Starting TCP server on {ip_address}:{port}")
+        server = QTcpServer(self, newConnection=self.new_connection)  # type:ignore
+        server.listen(QHostAddress(ip_address), port)
+        if not server.isListening():
+            raise Exception(
+                f"{self.__class__.__name__} not able to listen on {ip_address}:{port}"
+            )
+        self._servers.append(server)
+
+    @pyqtSlot()
+    def new_connection(self):
+        server: QTcpServer = self.sender()
+        while server.hasPendingConnections():
+            socket: QTcpSocket = server.nextPendingConnection()
+            if not self._connections.can_accept(self):
+                logger.warning(
+                    f"Refusing TCP connection from {socket.peerAddress().toString()}:"
+                    f"{socket.peerPort()}, connection limit reached"
+                )
+                socket.abort()
+                socket.deleteLater()
+                continue
+
+            logger.debug(
+                f"New TCP connection from {socket.peerAddress().toString()}:{socket.peerPort()}"
+            )
+            socket.readyRead.connect(self.read_data)
+            socket.disconnected.connect(self.remove_socket)
+            self._sockets[socket] = ConnectionInfo()
+            self._connections.connection_opened(self)
+
+    @pyqtSlot()
+    def read_data(self):
+        socket: QTcpSocket = self.sender()
+        data = socket.readAll().data()
+        self._sockets[socket].received(data)
+        msg = data.decode("utf8")
+        logger.debug(f"Received message:\n{msg}")
+
+        handler: Optional[Callable[[], None]] = None
+        if msg.startswith("GET /setup.xml HTTP/1.1"):
+            logger.info("setup.xml requested by Echo")
+            handler = partial(self.handle_setup, socket)
+        elif "/eventservice.xml" in msg:
+            logger.info("eventservice.xml requested by Echo")
+            handler = partial(self.handle_event, socket)
+        elif "/metainfoservice.xml" in msg:
+            logger.info("metainfoservice.xml requested by Echo")
+            handler = partial(self.handle_metainfo, socket)
+        elif msg.startswith("POST /upnp/control/basicevent1 HTTP/1.1"):
+            logger.info("BasicEvent1 requested")
+            handler = partial(self.handle_action, msg, socket)
+        elif msg.startswith("SUBSCRIBE /upnp/event/basicevent1 HTTP/1.1"):
+            logger.info("BasicEvent1 subscription requested")
+            handler = partial(self.handle_subscription, msg, socket, subscribe=True)
+        elif msg.startswith("UNSUBSCRIBE /upnp/event/basicevent1 HTTP/1.1"):
+            logger.info("BasicEvent1 unsubscription requested")
+            handler = partial(self.handle_subscription, msg, socket, subscribe=False)
+
+        if handler:
+            with timing_span(f"JemoDevice.{handler.func.__name__}"):
+                handler()
+
+    @pyqtSlot()
+    def remove_socket(self):
+        logger.debug("Delete socket")
+        socket: QTcpSocket = self.sender()
+        if self._sockets.pop(socket, None) is not None:
+            self._connections.connection_closed(self)
+        socket.deleteLater()
+
+    @staticmethod
+    def add_http_headers(xml: str) -> str:
+        date_str = formatdate(timeval=None, localtime=False, usegmt=True)
+        return NEW_LINE.join(
+            [
+                "HTTP/1.1 200 OK",
+                f'CONTENT-LENGTH: {len(xml.encode("utf8"))}',
+                "CONTENT-TYPE: text/xml",
+                f"DATE: {date_str}",
+                "LAST-MODIFIED: Sat, 01 Jan 2000 00:01:15 GMT",
+                "SERVER: Unspecified, UPnP/1.0, Unspecified",
+                "X-User-Agent: Jemo",
+                f"CONNECTION: close{NEW_LINE}",
+                f"{xml}",
+            ]
+        )
+
+    def handle_setup(self, socket: QTcpSocket):
+        setup_xml = SETUP_XML(name=self.name, serial=self.serial)
+
+        setup_response = self.add_http_headers(setup_xml)
+        logger.debug(f"Jemo response to setup request:\n{setup_response}")
+        socket.write(setup_response.encode("utf8"))
+        socket.waitForBytesWritten()
+        socket.close()
+
+    def handle_event(self, socket: QTcpSocket):
+        eventservice_xml = EVENTSERVICE_XML
+
+        eventservice_response = self.add_http_headers(eventservice_xml)
+        logger.debug(f"Jemo response to eventservice request:\n{eventservice_response}")
+        socket.write(eventservice_response.encode("utf8"))
+        socket.waitForBytesWritten()
+        socket.close()
+
+    def handle_metainfo(self, socket: QTcpSocket):
+        metainfoservice_xml = METAINFOSERVICE_XML
+
+        metainfoservice_response = self.add_http_headers(metainfoservice_xml)
+        logger.debug(
+            f"Jemo response to metainfoservice request:\n{metainfoservice_response}"
+        )
+        socket.write(metainfoservice_response.encode("utf8"))
+        socket.waitForBytesWritten()
+        socket.close()
+
+    def handle_action(self, msg: str, socket: QTcpSocket):
+        logger.debug(f"Handling action for plugin type {self._plugin}")
+
+        soap_format = (
+            "<s:Envelope "
+            'xmlns:s="http://schemas.xmlsoap.org/soap/envelope/" '
+            's:encodingStyle="http://schemas.xmlsoap.org/soap/encoding/">'
+            "<s:Body>"
+            "<u:{action}{action_type}Response "
+            'xmlns:u="urn:Belkin:service:basicevent:1">'
+            "<{action_type}>{return_val}</{action_type}>"
+            "</u:{action}{action_type}Response>"
+            "</s:Body>"
+            "</s:Envelope>"
+        ).format
+
+        command_format = 'SOAPACTION: "urn:Belkin:service:basicevent:1#{}"'.format
+
+        action: Optional[str] = None
+        action_type: Optional[str] = None
+        return_val: Optional[str] = None
+        success: bool = False
+
+        if command_format("GetBinaryState").casefold() in msg.casefold():
+            logger.info(f"Attempting to get state for {self._plugin.name}")
+
+            action = "Get"
+            action_type = "BinaryState"
+            state = self.get_binary_state()
+            logger.info(f"{self._plugin.name} state: {state}")
+
+            if state in ("on", "off"):
+                success = True
+                return_val = str(int(state.lower() == "on"))
+
+        elif command_format("SetBinaryState").casefold() in msg.casefold():
+            action = "Set"
+            action_type = "BinaryState"
+
+            if "<BinaryState>0</BinaryState>" in msg:
+                logger.info(f"Attempting to turn off {self._plugin.name}")
+                return_val = "0"
+                success = self.set_binary_state("off")
+            elif "<BinaryState>1</BinaryState>" in msg:
+                logger.info(f"Attempting to turn on {self._plugin.name}")
+                return_val = "1"
+                success = self.set_binary_state("on")
+            else:
+                logger.warning(f"Unrecognized request:\n{msg}")
+
+        elif command_format("GetFriendlyName").casefold() in msg.casefold():
+            action = "Get"
+            action_type = "FriendlyName"
+            return_val = self._plugin.name
+            success = True
+            logger.info(f"{self._plugin.name} returning friendly name")
+
+        if success:
+            soap_message = soap_format(
+                action=action, action_type=action_type, return_val=return_val
+            )
+            response = self.add_http_headers(soap_message)
+            logger.debug(f"Successful SOAP response:\n{response}")
+            socket.write(response.encode("utf8"))
+            socket.waitForBytesWritten()
+        else:
+            logger.warning(
+                f"Unable to complete command for {self._plugin.name}:\n{msg}"
+            )
+            socket.close()
+
+    def get_binary_state(self) -> str:
+        # A debounced action that hasn't reached the backend yet is reported
+        # as the state, matching the optimistic response to SetBinaryState
+        if self.pending_action:
+            return self.pending_action
+        return self.read_plugin_state()
+
+    def read_plugin_state(self) -> str:
+        # May be called from any thread for thread safe plugins
+        with self._plugin_lock, timing_span(f"{self._plugin.name}.get_state"):
+            return self._plugin.get_state().casefold()
+
+    def perform_plugin_action(self, action: str) -> bool:
+        # May be called from any thread for thread safe plugins, the caller
+        # then calls action_performed() on the event loop
+        with self._plugin_lock, timing_span(f"{self._plugin.name}.{action}"):
+            return self._plugin.perform(action)
+
+    def start_plugin_call(self, call: str) -> Optional[Future]:
+        # Starts a non blocking "get" or action if the plugin has one, the
+        # future resolving on the event loop
+        future: Optional[Future]
+        if call == "get":
+            future = self._plugin.start_get_state()
+            span_name = f"{self._plugin.name}.get_state"
+        else:
+            future = self._plugin.start_perform(call)
+            span_name = f"{self._plugin.name}.{call}"
+        if future is not None:
+            started = time.perf_counter()
+            future.add_done_callback(
+                lambda _: spans.record(span_name, time.perf_counter() - started)
+            )
+        return future
+
+    def set_binary_state(self, action: str) -> bool:
+        if self._debouncer:
+            self._debouncer.submit(action)
+            # Subscribers see the pending state, as get_binary_state reports it
+            if self._events:
+                self._events.state_changed(action)
+            return True
+        return self.perform_action(action)
+
+    def perform_action(self, action: str) -> bool:
+        success = self.perform_plugin_action(action)
+        if success:
+            self.action_performed(action)
+        return success
+
+    def action_performed(self, action: str):
+        # Called on the event loop thread after the plugin performed an action
+        if self._events:
+            self._events.state_changed(action)
+        if self._state_store:
+            self._state_store.record(
+                self.serial,
+                self._plugin.latest_action,
+                self._plugin.latest_action_time,
+            )
+
+    def handle_subscription(self, msg: str, socket: QTcpSocket, subscribe: bool):
+        headers = parse_http_headers(msg)
+        if subscribe:
+            if self._events is None:
+                self._events = GENAEventService(
+                    self.get_binary_state,
+                    parent=self,
+                    **(self._events_config or {}),
+                )
+            status, response_headers = self._events.subscribe(headers)
+        elif self._events:
+            status, response_headers = self._events.unsubscribe(headers)
+        else:
+            status, response_headers = "412 Precondition Failed", {}
+
+        response = GENAEventService.make_response(status, response_headers)
+        logger.debug(f"Jemo response to subscription request:\n{response}")
+        socket.write(response.encode("utf8"))
+        socket.waitForBytesWritten()
+        socket.close()
+
+
+def load_device_configs(plugins: Mapping) -> List[DeviceConfig]:
+    device_configs: List[DeviceConfig] = []
+    plugin_module = importlib.import_module(f"{__package__}.plugins")
+    for plugin, plugin_config in plugins.items():
+        logger.debug(f"Loading plugin: {plugin}")
+
+        PluginClass = getattr(plugin_module, plugin)  # pylint:disable=invalid-name
+        if not issubclass(PluginClass, PluginBase):
+            raise TypeError(f"Plugins must inherit from {repr(PluginBase)}")
+
+        plugin_vars = {
+            k: v for k, v in plugin_config.items() if k not in ("devices", "path")
+        }
+        logger.debug(f"{plugin} vars: {plugin_vars}")
+
+        try:
+            devices = plugin_config["devices"]
+        except KeyError as exc:
+            raise Exception(f"No 'devices' configured for {plugin}!") from exc
+
+        for device in devices:
+            logger.debug(f"{plugin} device config: {repr(device)}")
+            device_configs.append((plugin, plugin_vars, device))
+    return device_configs
+
+
+def create_devices(  # pylint:disable=too-many-arguments
+    device_configs: List[DeviceConfig],
+    ip_addresses: Sequence[str],
+    *,
+    device_table: DeviceTable,
+    events_config: Optional[Mapping] = None,
+    state_store: Optional[StateJournal] = None,
+    connections_config: Optional[Mapping] = None,
+    debounce_window: int = 0,
+) -> List[JemoDevice]:
+    connections = ConnectionTracker(**(connections_config or {}))
+    jemo_devices: List[JemoDevice] = []
+    plugin_module = importlib.import_module(f"{__package__}.plugins")
+    for plugin, plugin_vars, device in device_configs:
+        PluginClass = getattr(plugin_module, plugin)  # pylint:disable=invalid-name
+        device_plugin = PluginClass(**plugin_vars, **device)
+        jemo_device = JemoDevice(
+            device_plugin.name,
+            device_plugin,
+            device_table=device_table,
+            events=events_config,
+            state_store=state_store,
+            connections=connections,
+            debounce_window=debounce_window,
+        )
+        for ip_address in ip_addresses:
+            jemo_device.start_server(ip_address, device_plugin.port)
+        jemo_devices.append(jemo_device)
+    return jemo_devices
+
+
+def setup_devices(  # pylint:disable=too-many-arguments
+    application: QApplication,
+    device_configs: List[DeviceConfig],
+    ip_addresses: Sequence[str],
+    jemo_config: Mapping,
+    device_table: DeviceTable,
+    worker_index: Optional[int] = None,
+    diagnostics: Optional[Diagnostics] = None,
+) -> List[JemoDevice]:
+    state_store = None
+    state_file = jemo_config.get("state_file")
+    if state_file:
+        if worker_index is not None:
+            state_file = StateJournal.worker_path(state_file, worker_index)
+        state_store = StateJournal(state_file)
+        application.aboutToQuit.connect(state_store.close)
+
+    jemo_devices = create_devices(
+        device_configs,
+        ip_addresses,
+        device_table=device_table,
+        events_config=jemo_config.get("events"),
+        state_store=state_store,
+        connections_config=jemo_config.get("connections"),
+        debounce_window=jemo_config.get("debounce_window", 0),
+    )
+
+    management_config = dict(jemo_config.get("management") or {})
+    if management_config:
+        management_ip = management_config.pop("ip_address", "127.0.0.1")
+        # Each supervisor worker serves the API for its own devices
+        management_port = management_config.pop("port") + (worker_index or 0)
+        management_server = ManagementServer(
+            jemo_devices,
+            diagnostics=diagnostics,
+            parent=application,
+            **management_config,
+        )
+        management_server.start_server(management_ip, management_port)
+        application.aboutToQuit.connect(management_server.stop)
+
+    return jemo_devices
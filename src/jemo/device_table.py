@@ -0,0 +1,27 @@
+from typing import Iterator, List, Tuple
+
+from .utils import make_serial
+
+
+class DeviceTable:
+    # Names, serials and ports of all the devices in a process, held in
+    # parallel lists. JemoDevices add themselves and keep their index, and
+    # SSDPServer answers searches from the same table.
+    __slots__ = ("names", "serials", "ports")
+
+    def __init__(self) -> None:
+        self.names: List[str] = []
+        self.serials: List[str] = []
+        self.ports: List[int] = []
+
+    def add(self, name: str, port: int) -> int:
+        self.names.append(name)
+        self.serials.append(make_serial(name))
+        self.ports.append(port)
+        return len(self.names) - 1
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def __iter__(self) -> Iterator[Tuple[str, str, int]]:
+        return zip(self.names, self.serials, self.ports)
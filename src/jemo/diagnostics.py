@@ -0,0 +1,212 @@
+import cProfile
+import os
+import signal
+import sys
+import threading
+import time
+import traceback
+from contextlib import contextmanager
+from typing import Dict, Iterator, Mapping, Optional
+
+from PyQt6.QtCore import QObject, QTimer, pyqtSlot
+
+from . import logger
+
+
+class SpanStats:  # pylint:disable=too-few-public-methods
+    __slots__ = ("count", "total", "max")
+
+    def __init__(self) -> None:
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, duration: float) -> None:
+        self.count += 1
+        self.total += duration
+        self.max = max(self.max, duration)
+
+
+class SpanRecorder:
+    def __init__(self, slow_threshold: float = 0.1) -> None:
+        self.slow_threshold = slow_threshold
+        self.stats: Dict[str, SpanStats] = {}
+
+    @contextmanager
+    def span(self, name: str) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - started)
+
+    def record(self, name: str, duration: float) -> None:
+        stats = self.stats.get(name)
+        if stats is None:
+            stats = self.stats[name] = SpanStats()
+        stats.add(duration)
+        if duration > self.slow_threshold:
+            logger.warning(f"Slow span '{name}': {duration * 1000:.1f}ms")
+
+    def summary(self) -> str:
+        return "\n".join(
+            f"{name}: count {stats.count}, "
+            f"mean {stats.total / stats.count * 1000:.2f}ms, "
+            f"max {stats.max * 1000:.2f}ms"
+            for name, stats in sorted(
+                self.stats.items(), key=lambda item: item[1].total, reverse=True
+            )
+        )
+
+
+spans = SpanRecorder()
+timing_span = spans.span
+
+
+class LoopWatchdog(QObject):  # pylint:disable=too-many-instance-attributes
+    # A timer on the event loop measures how late it fires, while a sampling
+    # thread logs the main thread's stack if the timer stops firing for longer
+    # than lag_threshold, i.e. while the loop is blocked.
+    def __init__(
+        self,
+        *,
+        interval: int = 100,
+        lag_threshold: int = 500,
+        parent=None,
+        **kwargs,
+    ):
+        super().__init__(parent, **kwargs)
+        self._interval = interval / 1000
+        self._lag_threshold = lag_threshold / 1000
+        self._main_thread_id = threading.get_ident()
+        self._last_tick = time.monotonic()
+        self._stalled_since: Optional[float] = None
+        self._max_lag = 0.0
+
+        self._timer = QTimer(self, timeout=self.tick)  # type:ignore
+        self._stop = threading.Event()
+        self._sampler = threading.Thread(
+            target=self.sample, name="jemo-watchdog", daemon=True
+        )
+
+    @property
+    def max_lag(self) -> float:
+        return self._max_lag
+
+    def start(self):
+        self._last_tick = time.monotonic()
+        self._timer.start(int(self._interval * 1000))
+        self._sampler.start()
+
+    @pyqtSlot()
+    def stop(self):
+        self._timer.stop()
+        self._stop.set()
+
+    @pyqtSlot()
+    def tick(self):
+        now = time.monotonic()
+        lag = now - self._last_tick - self._interval
+        self._last_tick = now
+        self._max_lag = max(self._max_lag, lag)
+        if lag > self._lag_threshold:
+            logger.warning(f"Event loop lag: {lag * 1000:.0f}ms")
+
+    def sample(self):
+        while not self._stop.wait(self._interval):
+            stalled_for = time.monotonic() - self._last_tick
+            if stalled_for <= self._lag_threshold:
+                self._stalled_since = None
+                continue
+            # Only report each stall once
+            if self._stalled_since == self._last_tick:
+                continue
+            self._stalled_since = self._last_tick
+
+            frame = sys._current_frames().get(  # pylint:disable=protected-access
+                self._main_thread_id
+            )
+            if frame is not None:
+                stack = "".join(traceback.format_stack(frame))
+                logger.warning(
+                    f"Event loop blocked for {stalled_for * 1000:.0f}ms in:\n{stack}"
+                )
+
+
+class Profiler(QObject):
+    def __init__(self, *, profile_dir: str = ".", parent=None, **kwargs):
+        super().__init__(parent, **kwargs)
+        self._profile_dir = profile_dir
+        self._profile: Optional[cProfile.Profile] = None
+
+    @property
+    def running(self) -> bool:
+        return self._profile is not None
+
+    def start(self):
+        if self._profile is None:
+            logger.info("Starting profiler")
+            self._profile = cProfile.Profile()
+            self._profile.enable()
+
+    def stop(self) -> Optional[str]:
+        if self._profile is None:
+            return None
+        self._profile.disable()
+        path = os.path.join(
+            self._profile_dir,
+            f"jemo-{os.getpid()}-{time.strftime('%Y%m%d-%H%M%S')}.prof",
+        )
+        self._profile.dump_stats(path)
+        self._profile = None
+        logger.info(f"Profile written to {path}")
+        logger.info(f"Timing spans:\n{spans.summary()}")
+        return path
+
+    def toggle(self):
+        if self.running:
+            self.stop()
+        else:
+            self.start()
+
+
+class Diagnostics(QObject):
+    def __init__(
+        self,
+        *,
+        watchdog_interval: int = 100,
+        lag_threshold: int = 500,
+        slow_span_threshold: int = 100,
+        profile_dir: str = ".",
+        parent=None,
+        **kwargs,
+    ):  # pylint:disable=too-many-arguments
+        super().__init__(parent, **kwargs)
+        spans.slow_threshold = slow_span_threshold / 1000
+
+        self.watchdog: Optional[LoopWatchdog] = None
+        if watchdog_interval > 0:
+            self.watchdog = LoopWatchdog(
+                interval=watchdog_interval, lag_threshold=lag_threshold, parent=self
+            )
+        self.profiler = Profiler(profile_dir=profile_dir, parent=self)
+
+    def start(self):
+        if self.watchdog:
+            self.watchdog.start()
+        # SIGUSR1 toggles the profiler, where available
+        if hasattr(signal, "SIGUSR1"):
+            signal.signal(signal.SIGUSR1, lambda *_: self.profiler.toggle())
+
+    @pyqtSlot()
+    def stop(self):
+        if self.watchdog:
+            self.watchdog.stop()
+        self.profiler.stop()
+
+
+def setup_diagnostics(application: QObject, config: Optional[Mapping]) -> Diagnostics:
+    diagnostics = Diagnostics(parent=application, **(config or {}))
+    diagnostics.start()
+    application.aboutToQuit.connect(diagnostics.stop)  # type:ignore
+    return diagnostics
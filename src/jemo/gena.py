@@ -0,0 +1,215 @@
+import time
+import uuid
+from email.utils import formatdate
+from functools import partial
+from typing import Callable, Dict, Mapping, Optional, Tuple
+
+from PyQt6.QtCore import QObject, QTimer, QUrl, pyqtSlot
+from PyQt6.QtNetwork import QNetworkAccessManager, QNetworkReply, QNetworkRequest
+
+from . import logger
+
+NEW_LINE = "\r\n"
+DEFAULT_TIMEOUT = 1800
+MIN_TIMEOUT = 60
+MAX_TIMEOUT = 86400
+
+BINARY_STATE_PROPERTY_SET = (
+    '<e:propertyset xmlns:e="urn:schemas-upnp-org:event-1-0">'
+    "<e:property>"
+    "<BinaryState>{}</BinaryState>"
+    "</e:property>"
+    "</e:propertyset>"
+).format
+
+
+class Subscription:
+    __slots__ = ("sid", "callback", "timeout", "expires", "seq")
+
+    def __init__(self, callback: str, timeout: int) -> None:
+        self.sid = f"uuid:{uuid.uuid4()}"
+        self.callback = callback
+        self.timeout = timeout
+        self.expires = time.monotonic() + timeout
+        self.seq = 0
+
+    def renew(self, timeout: int) -> None:
+        self.timeout = timeout
+        self.expires = time.monotonic() + timeout
+
+    def next_seq(self) -> int:
+        seq = self.seq
+        # SEQ wraps to 1, not 0, which is reserved for the initial event
+        self.seq = seq + 1 if seq < 0xFFFFFFFF else 1
+        return seq
+
+
+class GENAEventService(QObject):  # pylint:disable=too-many-instance-attributes
+    def __init__(
+        self,
+        state_getter: Callable[[], str],
+        *,
+        default_timeout: int = DEFAULT_TIMEOUT,
+        state_check_interval: int = 0,
+        parent=None,
+        **kwargs,
+    ) -> None:
+        super().__init__(parent, **kwargs)
+        self._state_getter = state_getter
+        self._default_timeout = default_timeout
+        self._subscriptions: Dict[str, Subscription] = {}
+        self._last_state: Optional[str] = None
+        self._nam: Optional[QNetworkAccessManager] = None
+
+        self._sweep_timer = QTimer(self, timeout=self.sweep)  # type: ignore
+        self._sweep_timer.start(MIN_TIMEOUT * 1000)
+
+        self._state_check_timer = QTimer(self, timeout=self.check_state)  # type: ignore
+        self._state_check_interval = state_check_interval
+
+    @property
+    def subscriptions(self) -> Mapping[str, Subscription]:
+        return self._subscriptions
+
+    def _parse_timeout(self, header: Optional[str]) -> int:
+        if header and header.lower().startswith("second-"):
+            value = header[len("second-") :]
+            if value.isdigit():
+                return max(MIN_TIMEOUT, min(MAX_TIMEOUT, int(value)))
+            if value.lower() == "infinite":
+                return MAX_TIMEOUT
+        return self._default_timeout
+
+    def subscribe(self, headers: Mapping[str, str]) -> Tuple[str, Dict[str, str]]:
+        timeout = self._parse_timeout(headers.get("TIMEOUT"))
+        sid = headers.get("SID")
+        callback = headers.get("CALLBACK")
+
+        if sid:
+            if callback or "NT" in headers:
+                return "400 Bad Request", {}
+            subscription = self._subscriptions.get(sid)
+            if subscription is None:
+                return "412 Precondition Failed", {}
+            subscription.renew(timeout)
+            logger.debug(f"Renewed subscription {sid} for {timeout}s")
+        else:
+            if headers.get("NT") != "upnp:event" or not callback:
+                return "412 Precondition Failed", {}
+            # Only the first of the (possibly several) callback URLs is used
+            url = callback.split(">", 1)[0].lstrip("<").strip()
+            if not QUrl(url).isValid():
+                return "412 Precondition Failed", {}
+            subscription = Subscription(url, timeout)
+            self._subscriptions[subscription.sid] = subscription
+            logger.info(f"New subscription {subscription.sid} to {url}")
+
+            sid = subscription.sid
+            QTimer.singleShot(0, lambda: self.send_initial_event(sid))
+            self._update_state_check_timer()
+
+        return "200 OK", {
+            "SID": subscription.sid,
+            "TIMEOUT": f"Second-{subscription.timeout}",
+        }
+
+    def unsubscribe(self, headers: Mapping[str, str]) -> Tuple[str, Dict[str, str]]:
+        sid = headers.get("SID")
+        if not sid:
+            return "412 Precondition Failed", {}
+        if headers.get("CALLBACK") or "NT" in headers:
+            return "400 Bad Request", {}
+        if self._subscriptions.pop(sid, None) is None:
+            return "412 Precondition Failed", {}
+        logger.info(f"Removed subscription {sid}")
+        self._update_state_check_timer()
+        return "200 OK", {}
+
+    @staticmethod
+    def make_response(status: str, headers: Mapping[str, str]) -> str:
+        date_str = formatdate(timeval=None, localtime=False, usegmt=True)
+        return (
+            NEW_LINE.join(
+                [
+                    f"HTTP/1.1 {status}",
+                    f"DATE: {date_str}",
+                    "SERVER: Unspecified, UPnP/1.0, Unspecified",
+                    *(f"{key}: {value}" for key, value in headers.items()),
+                    "CONTENT-LENGTH: 0",
+                    "CONNECTION: close",
+                ]
+            )
+            + 2 * NEW_LINE
+        )
+
+    def _update_state_check_timer(self):
+        if self._subscriptions and self._state_check_interval > 0:
+            if not self._state_check_timer.isActive():
+                self._state_check_timer.start(self._state_check_interval * 1000)
+        else:
+            self._state_check_timer.stop()
+
+    @pyqtSlot()
+    def sweep(self):
+        now = time.monotonic()
+        expired = [
+            sid
+            for sid, subscription in self._subscriptions.items()
+            if subscription.expires <= now
+        ]
+        for sid in expired:
+            logger.info(f"Subscription {sid} expired")
+            del self._subscriptions[sid]
+        if expired:
+            self._update_state_check_timer()
+
+    @pyqtSlot()
+    def check_state(self):
+        state = self._state_getter()
+        if state in ("on", "off"):
+            self.state_changed(state)
+
+    def send_initial_event(self, sid: str):
+        subscription = self._subscriptions.get(sid)
+        if subscription is None:
+            return
+        if self._last_state is None:
+            state = self._state_getter()
+            if state not in ("on", "off"):
+                return
+            self._last_state = state
+        self._send_notify(subscription, self._last_state)
+
+    def state_changed(self, state: str):
+        if state == self._last_state:
+            return
+        self._last_state = state
+        for subscription in self._subscriptions.values():
+            self._send_notify(subscription, state)
+
+    def _send_notify(self, subscription: Subscription, state: str):
+        if self._nam is None:
+            self._nam = QNetworkAccessManager(self)
+
+        body = BINARY_STATE_PROPERTY_SET(int(state == "on")).encode("utf8")
+        request = QNetworkRequest(QUrl(subscription.callback))
+        request.setHeader(
+            QNetworkRequest.KnownHeaders.ContentTypeHeader, 'text/xml; charset="utf-8"'
+        )
+        request.setRawHeader(b"NT", b"upnp:event")
+        request.setRawHeader(b"NTS", b"upnp:propchange")
+        request.setRawHeader(b"SID", subscription.sid.encode("utf8"))
+        request.setRawHeader(b"SEQ", str(subscription.next_seq()).encode("utf8"))
+
+        logger.debug(f"NOTIFY {subscription.callback} ({subscription.sid}): {state}")
+        reply = self._nam.sendCustomRequest(request, b"NOTIFY", body)
+        if reply is None:
+            logger.warning(f"NOTIFY for {subscription.sid} could not be sent")
+            return
+        reply.finished.connect(partial(self._notify_finished, reply, subscription.sid))
+
+    @staticmethod
+    def _notify_finished(reply: QNetworkReply, sid: str):
+        if reply.error() != QNetworkReply.NetworkError.NoError:
+            logger.warning(f"NOTIFY for {sid} failed: {reply.errorString()}")
+        reply.deleteLater()
@@ -1,4 +1,3 @@
-import importlib
 import os.path
 import signal
 import sys
@@ -6,293 +5,28 @@ import uuid
 from email.utils import formatdate
 from functools import partial
 from random import random
-from typing import List, Optional
+from typing import Optional, Sequence
 
 from PyQt6.QtCore import QObject, QTimer, pyqtSlot
 from PyQt6.QtNetwork import (
     QHostAddress,
     QNetworkDatagram,
-    QTcpServer,
-    QTcpSocket,
+    QNetworkInterface,
     QUdpSocket,
 )
 from PyQt6.QtWidgets import QApplication
 
 from . import logger
 from .config import load_config_file
-from .plugins import PluginBase
-from .utils import get_local_ip, make_serial
+from .device import load_device_configs, setup_devices
+from .device_table import DeviceTable
+from .diagnostics import setup_diagnostics
+from .supervisor import Supervisor
+from .utils import LocalAddress, resolve_local_addresses
 
 NEW_LINE = "\r\n"
 
 
-class JemoDevice(QObject):
-    def __init__(self, name: str, plugin: PluginBase, **kwargs) -> None:
-        super().__init__(parent=None, **kwargs)  # type:ignore
-        self._name = name
-        self._serial = make_serial(name)
-        self._plugin = plugin
-        self._server: Optional[QTcpServer] = None
-        self._sockets: List[QTcpSocket] = []
-
-    def start_server(self, ip_address: str, port: int):
-        logger.debug(f"Starting TCP server on {ip_address}:{port}")
-        self._server = QTcpServer(
-            self, newConnection=self.new_connection
-        )  # type:ignore
-        self._server.listen(QHostAddress(ip_address), port)
-        if not self._server.isListening():
-            raise Exception(
-                f"{self.__class__.__name__} not able to listen on {ip_address}:{port}"
-            )
-
-    @pyqtSlot()
-    def new_connection(self):
-        socket: QTcpSocket = self._server.nextPendingConnection()
-        logger.debug(
-            f"New TCP connection from {socket.peerAddress().toString()}:{socket.peerPort()}"
-        )
-        socket.readyRead.connect(self.read_data)
-        socket.disconnected.connect(self.remove_socket)
-        self._sockets.append(socket)
-
-    @pyqtSlot()
-    def read_data(self):
-        socket: QTcpSocket = self.sender()
-        msg = socket.readAll().data().decode("utf8")
-        logger.debug(f"Received message:\n{msg}")
-
-        if msg.startswith("GET /setup.xml HTTP/1.1"):
-            logger.info("setup.xml requested by Echo")
-            self.handle_setup(socket)
-        elif "/eventservice.xml" in msg:
-            logger.info("eventservice.xml requested by Echo")
-            self.handle_event(socket)
-        elif "/metainfoservice.xml" in msg:
-            logger.info("metainfoservice.xml requested by Echo")
-            self.handle_metainfo(socket)
-        elif msg.startswith("POST /upnp/control/basicevent1 HTTP/1.1"):
-            logger.info("BasicEvent1 requested")
-            self.handle_action(msg, socket)
-
-    @pyqtSlot()
-    def remove_socket(self):
-        logger.debug("Delete socket")
-        socket: QTcpSocket = self.sender()
-        self._sockets.remove(socket)
-        socket.deleteLater()
-
-    @staticmethod
-    def add_http_headers(xml: str) -> str:
-        date_str = formatdate(timeval=None, localtime=False, usegmt=True)
-        return NEW_LINE.join(
-            [
-                "HTTP/1.1 200 OK",
-                f'CONTENT-LENGTH: {len(xml.encode("utf8"))}',
-                "CONTENT-TYPE: text/xml",
-                f"DATE: {date_str}",
-                "LAST-MODIFIED: Sat, 01 Jan 2000 00:01:15 GMT",
-                "SERVER: Unspecified, UPnP/1.0, Unspecified",
-                "X-User-Agent: Jemo",
-                f"CONNECTION: close{NEW_LINE}",
-                f"{xml}",
-            ]
-        )
-
-    def handle_setup(self, socket: QTcpSocket):
-        setup_xml = (
-            '<?xml version="1.0"?>'
-            "<root>"
-            "<specVersion><major>1</major><minor>0</minor></specVersion>"
-            "<device>"
-            "<deviceType>urn:Belkin:device:controllee:1</deviceType>"
-            f"<friendlyName>{self._name}</friendlyName>"
-            "<manufacturer>Belkin International Inc.</manufacturer>"
-            "<modelName>Emulated Socket</modelName>"
-            "<modelNumber>3.1415</modelNumber>"
-            f"<UDN>uuid:Socket-1_0-{self._serial}</UDN>"
-            "<serviceList>"
-            "<service>"
-            "<serviceType>urn:Belkin:service:basicevent:1</serviceType>"
-            "<serviceId>urn:Belkin:serviceId:basicevent1</serviceId>"
-            "<controlURL>/upnp/control/basicevent1</controlURL>"
-            "<eventSubURL>/upnp/event/basicevent1</eventSubURL>"
-            "<SCPDURL>/eventservice.xml</SCPDURL>"
-            "</service>"
-            "<service>"
-            "<serviceType>urn:Belkin:service:metainfo:1</serviceType>"
-            "<serviceId>urn:Belkin:serviceId:metainfo1</serviceId>"
-            "<controlURL>/upnp/control/metainfo1</controlURL>"
-            "<eventSubURL>/upnp/event/metainfo1</eventSubURL>"
-            "<SCPDURL>/metainfoservice.xml</SCPDURL>"
-            "</service>"
-            "</serviceList>"
-            "</device>"
-            "</root>"
-        )
-
-        setup_response = self.add_http_headers(setup_xml)
-        logger.debug(f"Jemo response to setup request:\n{setup_response}")
-        socket.write(setup_response.encode("utf8"))
-        socket.waitForBytesWritten()
-        socket.close()
-
-    def handle_event(self, socket: QTcpSocket):
-        eventservice_xml = (
-            '<scpd xmlns="urn:Belkin:service-1-0">'
-            "<actionList>"
-            "<action>"
-            "<name>SetBinaryState</name>"
-            "<argumentList>"
-            "<argument>"
-            "<retval/>"
-            "<name>BinaryState</name>"
-            "<relatedStateVariable>BinaryState</relatedStateVariable>"
-            "<direction>in</direction>"
-            "</argument>"
-            "</argumentList>"
-            "</action>"
-            "<action>"
-            "<name>GetBinaryState</name>"
-            "<argumentList>"
-            "<argument>"
-            "<retval/>"
-            "<name>BinaryState</name>"
-            "<relatedStateVariable>BinaryState</relatedStateVariable>"
-            "<direction>out</direction>"
-            "</argument>"
-            "</argumentList>"
-            "</action>"
-            "</actionList>"
-            "<serviceStateTable>"
-            '<stateVariable sendEvents="yes">'
-            "<name>BinaryState</name>"
-            "<dataType>Boolean</dataType>"
-            "<defaultValue>0</defaultValue>"
-            "</stateVariable>"
-            '<stateVariable sendEvents="yes">'
-            "<name>level</name>"
-            "<dataType>string</dataType>"
-            "<defaultValue>0</defaultValue>"
-            "</stateVariable>"
-            "</serviceStateTable>"
-            "</scpd>"
-        ) + 2 * NEW_LINE
-
-        eventservice_response = self.add_http_headers(eventservice_xml)
-        logger.debug(f"Jemo response to eventservice request:\n{eventservice_response}")
-        socket.write(eventservice_response.encode("utf8"))
-        socket.waitForBytesWritten()
-        socket.close()
-
-    def handle_metainfo(self, socket: QTcpSocket):
-        metainfoservice_xml = (
-            '<scpd xmlns="urn:Belkin:service-1-0">'
-            "<specVersion>"
-            "<major>1</major>"
-            "<minor>0</minor>"
-            "</specVersion>"
-            "<actionList>"
-            "<action>"
-            "<name>GetMetaInfo</name>"
-            "<argumentList>"
-            "<retval />"
-            "<name>GetMetaInfo</name>"
-            "<relatedStateVariable>MetaInfo</relatedStateVariable>"
-            "<direction>in</direction>"
-            "</argumentList>"
-            "</action>"
-            "</actionList>"
-            "<serviceStateTable>"
-            '<stateVariable sendEvents="yes">'
-            "<name>MetaInfo</name>"
-            "<dataType>string</dataType>"
-            "<defaultValue>0</defaultValue>"
-            "</stateVariable>"
-            "</serviceStateTable>"
-            "</scpd>"
-        ) + 2 * NEW_LINE
-
-        metainfoservice_response = self.add_http_headers(metainfoservice_xml)
-        logger.debug(
-            f"Jemo response to metainfoservice request:\n{metainfoservice_response}"
-        )
-        socket.write(metainfoservice_response.encode("utf8"))
-        socket.waitForBytesWritten()
-        socket.close()
-
-    def handle_action(self, msg: str, socket: QTcpSocket):
-        logger.debug(f"Handling action for plugin type {self._plugin}")
-
-        soap_format = (
-            "<s:Envelope "
-            'xmlns:s="http://schemas.xmlsoap.org/soap/envelope/" '
-            's:encodingStyle="http://schemas.xmlsoap.org/soap/encoding/">'
-            "<s:Body>"
-            "<u:{action}{action_type}Response "
-            'xmlns:u="urn:Belkin:service:basicevent:1">'
-            "<{action_type}>{return_val}</{action_type}>"
-            "</u:{action}{action_type}Response>"
-            "</s:Body>"
-            "</s:Envelope>"
-        ).format
-
-        command_format = 'SOAPACTION: "urn:Belkin:service:basicevent:1#{}"'.format
-
-        action: Optional[str] = None
-        action_type: Optional[str] = None
-        return_val: Optional[str] = None
-        success: bool = False
-
-        if command_format("GetBinaryState").casefold() in msg.casefold():
-            logger.info(f"Attempting to get state for {self._plugin.name}")
-
-            action = "Get"
-            action_type = "BinaryState"
-            state = self._plugin.get_state().casefold()
-            logger.info(f"{self._plugin.name} state: {state}")
-
-            if state in ("on", "off"):
-                success = True
-                return_val = str(int(state.lower() == "on"))
-
-        elif command_format("SetBinaryState").casefold() in msg.casefold():
-            action = "Set"
-            action_type = "BinaryState"
-
-            if "<BinaryState>0</BinaryState>" in msg:
-                logger.info(f"Attempting to turn off {self._plugin.name}")
-                return_val = "0"
-                success = self._plugin.off()
-            elif "<BinaryState>1</BinaryState>" in msg:
-                logger.info(f"Attempting to turn on {self._plugin.name}")
-                return_val = "1"
-                success = self._plugin.on()
-            else:
-                logger.warning(f"Unrecognized request:\n{msg}")
-
-        elif command_format("GetFriendlyName").casefold() in msg.casefold():
-            action = "Get"
-            action_type = "FriendlyName"
-            return_val = self._plugin.name
-            success = True
-            logger.info(f"{self._plugin.name} returning friendly name")
-
-        if success:
-            soap_message = soap_format(
-                action=action, action_type=action_type, return_val=return_val
-            )
-            response = self.add_http_headers(soap_message)
-            logger.debug(f"Successful SOAP response:\n{response}")
-            socket.write(response.encode("utf8"))
-            socket.waitForBytesWritten()
-        else:
-            logger.warning(
-                f"Unable to complete command for {self._plugin.name}:\n{msg}"
-            )
-            socket.close()
-
-
 class SSDPServer(QObject):
     DISCOVER_PATTERNS = (
         "ST: urn:Belkin:device:**",
@@ -300,14 +34,44 @@ class SSDPServer(QObject):
         "ST: ssdp:all",
     )
 
-    def __init__(self, parent=None, **kwargs):
+    MULTICAST_GROUP = "239.255.255.250"
+
+    def __init__(
+        self,
+        addresses: Sequence[LocalAddress],
+        device_table: Optional[DeviceTable] = None,
+        parent=None,
+        **kwargs,
+    ):
         super().__init__(parent, **kwargs)
 
-        self._devices: List[dict] = []
+        self._addresses = addresses
+        self._devices = device_table if device_table is not None else DeviceTable()
         self._socket: Optional[QUdpSocket] = None
 
-    def add_device(self, name: str, ip_address: str, port: int):
-        self._devices.append({"name": name, "ip_address": ip_address, "port": port})
+    def add_device(self, name: str, port: int):
+        self._devices.add(name, port)
+
+    def local_address_for(self, datagram: QNetworkDatagram) -> LocalAddress:
+        # Answer with the address of the interface the search arrived on, so
+        # that LOCATION is reachable from the searcher
+        interface_index = datagram.interfaceIndex()
+        sender_address = datagram.senderAddress()
+        return next(
+            (
+                address
+                for address in self._addresses
+                if interface_index and address.interface_index == interface_index
+            ),
+            next(
+                (
+                    address
+                    for address in self._addresses
+                    if address.contains(sender_address)
+                ),
+                self._addresses[0],
+            ),
+        )
 
     def start_server(self):
         self._socket = QUdpSocket(
@@ -319,7 +83,18 @@ class SSDPServer(QObject):
             mode=QUdpSocket.BindFlag.ReuseAddressHint,
         ):
             raise Exception("SSDPServer not able to bind port 1900")
-        self._socket.joinMulticastGroup(QHostAddress("239.255.255.0"))
+
+        group = QHostAddress(self.MULTICAST_GROUP)
+        joined = set()
+        for address in self._addresses:
+            if address.interface_index in joined:
+                continue
+            joined.add(address.interface_index)
+            interface = QNetworkInterface.interfaceFromIndex(address.interface_index)
+            if not interface.isValid():
+                self._socket.joinMulticastGroup(group)
+            elif not self._socket.joinMulticastGroup(group, interface):
+                logger.warning(f"Unable to join SSDP multicast group on {address}")
 
     @pyqtSlot("qint64")
     def bytes_written(self, num_bytes):  # pylint:disable=no-self-use
@@ -355,7 +130,11 @@ class SSDPServer(QObject):
                     if mx_str.replace(".", "", 1).isnumeric():
                         mx_value = float(mx_str)
                 self.respond_to_search(
-                    sender_address, sender_port, discover_pattern, mx_value
+                    sender_address,
+                    sender_port,
+                    discover_pattern,
+                    mx_value,
+                    self.local_address_for(datagram).ip_address,
                 )
 
     def respond_to_search(
@@ -364,16 +143,13 @@ class SSDPServer(QObject):
         sender_port: int,
         discover_pattern: str,
         mx_value: float = 0.0,
-    ):
+        ip_address: Optional[str] = None,
+    ):  # pylint:disable=too-many-arguments
         date_str = formatdate(timeval=None, localtime=False, usegmt=True)
-        for device in self._devices:
-            name = device["name"]
-            ip_address = device["ip_address"]
-            port = device["port"]
-
+        ip_address = ip_address or self._addresses[0].ip_address
+        for _, serial, port in self._devices:
             location = f"http://{ip_address}:{port}/setup.xml"
             logger.debug(f"Location: {location}")
-            serial = make_serial(name)
             usn = f"uuid:Socket-1_0-{serial}::" f'{discover_pattern.lstrip("ST: ")}'
 
             response = (
@@ -432,42 +208,47 @@ def main(config_file_path: str):
     signal.signal(signal.SIGTERM, signal_handler)
 
     jemo_config = config["jemo"]
-    jemo_ip = jemo_config.get("ip_address", "auto")
-    jemo_ip = get_local_ip(jemo_ip)
+    diagnostics = setup_diagnostics(application, jemo_config.get("diagnostics"))
+    local_addresses = resolve_local_addresses(
+        jemo_config.get("ip_address", "auto"), jemo_config.get("interfaces")
+    )
+    jemo_ips = [address.ip_address for address in local_addresses]
+
+    workers = jemo_config.get("workers", 1)
+    if workers == "auto":
+        workers = os.cpu_count() or 1
 
     try:
         plugins = jemo_config["plugins"]
     except KeyError as exc:
         raise Exception("No 'plugins' found in 'jemo' config") from exc
 
-    ssdp_server = SSDPServer()
-    jemo_devices: List[JemoDevice] = []
-    plugin_module = importlib.import_module(f"{__package__}.plugins")
-    for plugin, plugin_config in plugins.items():
-        logger.debug(f"Loading plugin: {plugin}")
-
-        PluginClass = getattr(plugin_module, plugin)  # pylint:disable=invalid-name
-        if not issubclass(PluginClass, PluginBase):
-            raise TypeError(f"Plugins must inherit from {repr(PluginBase)}")
-
-        plugin_vars = {
-            k: v for k, v in plugin_config.items() if k not in ("devices", "path")
-        }
-        logger.debug(f"{plugin} vars: {plugin_vars}")
-
-        try:
-            devices = plugin_config["devices"]
-        except KeyError as exc:
-            raise Exception(f"No 'devices' configured for {plugin}!") from exc
-
-        for device in devices:
-            logger.debug(f"{plugin} device config: {repr(device)}")
-
-            device_plugin = PluginClass(**plugin_vars, **device)
-            jemo_device = JemoDevice(device_plugin.name, device_plugin)
-            jemo_device.start_server(jemo_ip, device_plugin.port)
-            jemo_devices.append(jemo_device)
-            ssdp_server.add_device(device_plugin.name, jemo_ip, device_plugin.port)
+    device_configs = load_device_configs(plugins)
+
+    device_table = DeviceTable()
+    ssdp_server = SSDPServer(local_addresses, device_table)
+    if workers > 1:
+        supervisor = Supervisor(
+            device_configs,
+            jemo_ips,
+            jemo_config=jemo_config,
+            workers=workers,
+            **jemo_config.get("supervisor", {}),
+        )
+        for name, port in supervisor.devices():
+            ssdp_server.add_device(name, port)
+        supervisor.start()
+        application.aboutToQuit.connect(supervisor.stop)
+    else:
+        # The devices add themselves to the table SSDPServer answers from
+        setup_devices(
+            application,
+            device_configs,
+            jemo_ips,
+            jemo_config,
+            device_table,
+            diagnostics=diagnostics,
+        )
 
     ssdp_server.start_server()
 
@@ -0,0 +1,277 @@
+import json
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from email.utils import formatdate
+from typing import TYPE_CHECKING, Dict, List, Mapping, Optional, Tuple
+
+from PyQt6.QtCore import QObject, QTimer, pyqtSlot
+from PyQt6.QtNetwork import QHostAddress, QTcpServer, QTcpSocket
+
+from . import logger
+from .diagnostics import Diagnostics
+from .plugins.base import ACTIONS
+from .utils import parse_http_headers
+
+if TYPE_CHECKING:
+    from .device import JemoDevice
+
+NEW_LINE = "\r\n"
+HTTP_REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found"}
+
+# (device name, "get" or the action being set, future)
+PendingCall = Tuple[str, str, "Future"]
+
+
+class BulkRequest:  # pylint:disable=too-few-public-methods
+    def __init__(self, socket: Optional[QTcpSocket], deadline: float) -> None:
+        self.socket = socket
+        self.deadline = deadline
+        self.results: Dict[str, dict] = {}
+        self.pending: List[PendingCall] = []
+
+
+class ManagementServer(QObject):  # pylint:disable=too-many-instance-attributes
+    # JSON API for getting and setting many devices in one request, e.g.
+    #   POST /devices {"get": ["Lamp"], "set": {"Fan": "on"}, "timeout": 2}
+    # Non blocking plugin calls (e.g. HTTPPlugin) are all started at once and
+    # thread safe plugins are called concurrently on a thread pool, with the
+    # results collected by poll() until the deadline. Other plugins are called
+    # in turn on the event loop. The same JemoDevice (and so plugin, debouncer
+    # and state journal) as the WeMo SOAP endpoint is used.
+    def __init__(
+        self,
+        devices: List["JemoDevice"],
+        *,
+        diagnostics: Optional[Diagnostics] = None,
+        timeout: float = 5.0,
+        max_workers: int = 8,
+        parent=None,
+        **kwargs,
+    ):  # pylint:disable=too-many-arguments
+        super().__init__(parent, **kwargs)
+        self._devices: Dict[str, "JemoDevice"] = {
+            device.name: device for device in devices
+        }
+        self._diagnostics = diagnostics
+        self._timeout = timeout
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="jemo-management"
+        )
+
+        self._server: Optional[QTcpServer] = None
+        self._buffers: Dict[QTcpSocket, bytearray] = {}
+        self._requests: List[BulkRequest] = []
+        self._poll_timer = QTimer(self, timeout=self.poll)  # type:ignore
+
+    def start_server(self, ip_address: str, port: int):
+        self._server = QTcpServer(
+            self, newConnection=self.new_connection
+        )  # type:ignore
+        self._server.listen(QHostAddress(ip_address), port)
+        if not self._server.isListening():
+            raise Exception(
+                f"{self.__class__.__name__} not able to listen on {ip_address}:{port}"
+            )
+        logger.info(f"Management API listening on {ip_address}:{port}")
+
+    @pyqtSlot()
+    def stop(self):
+        self._poll_timer.stop()
+        self._executor.shutdown(wait=False)
+
+    @pyqtSlot()
+    def new_connection(self):
+        while self._server.hasPendingConnections():
+            socket: QTcpSocket = self._server.nextPendingConnection()
+            socket.readyRead.connect(self.read_data)
+            socket.disconnected.connect(self.remove_socket)
+            self._buffers[socket] = bytearray()
+
+    @pyqtSlot()
+    def remove_socket(self):
+        socket: QTcpSocket = self.sender()
+        self._buffers.pop(socket, None)
+        for request in self._requests:
+            if request.socket is socket:
+                request.socket = None
+        socket.deleteLater()
+
+    @pyqtSlot()
+    def read_data(self):
+        socket: QTcpSocket = self.sender()
+        buffer = self._buffers.get(socket)
+        if buffer is None:
+            return
+        buffer += socket.readAll().data()
+
+        header_end = buffer.find(b"\r\n\r\n")
+        if header_end == -1:
+            return
+        head = buffer[:header_end].decode("utf8", errors="replace")
+        content_length = parse_http_headers(head).get("CONTENT-LENGTH", "0")
+        body_end = (
+            header_end + 4 + (int(content_length) if content_length.isdigit() else 0)
+        )
+        if len(buffer) < body_end:
+            return
+        body = bytes(buffer[header_end + 4 : body_end])
+        del self._buffers[socket]
+
+        method, _, path = head.split(NEW_LINE, 1)[0].partition(" ")
+        path = path.split(" ", 1)[0]
+        logger.debug(f"Management request: {method} {path}")
+
+        if path == "/devices" and method in ("GET", "POST"):
+            try:
+                payload = json.loads(body) if body.strip() else {"get": "*"}
+                if not isinstance(payload, dict):
+                    raise ValueError("Request body must be a JSON object")
+                self.handle_bulk(socket, payload)
+            except (ValueError, TypeError) as exc:
+                self.respond(socket, 400, {"error": str(exc)})
+        elif path in ("/profiler/start", "/profiler/stop") and method == "POST":
+            self.handle_profiler(socket, path.rsplit("/", 1)[-1])
+        else:
+            self.respond(socket, 404, {"error": f"No route for {method} {path}"})
+
+    def handle_profiler(self, socket: QTcpSocket, command: str):
+        if self._diagnostics is None:
+            self.respond(socket, 404, {"error": "Diagnostics not enabled"})
+            return
+        profiler = self._diagnostics.profiler
+        if command == "start":
+            profiler.start()
+            self.respond(socket, 200, {"running": True})
+        else:
+            self.respond(socket, 200, {"running": False, "profile": profiler.stop()})
+
+    def handle_bulk(self, socket: QTcpSocket, payload: Mapping):
+        gets = payload.get("get", [])
+        if gets == "*":
+            gets = list(self._devices)
+        sets = payload.get("set", {})
+        if not isinstance(gets, list) or not isinstance(sets, dict):
+            raise ValueError("'get' must be a list (or '*') and 'set' an object")
+
+        timeout = float(payload.get("timeout", self._timeout))
+        request = BulkRequest(socket, time.monotonic() + timeout)
+        # Calls are started before any are waited on, so that they overlap
+        blocking_calls: List[Tuple[str, str]] = []
+
+        for name, action in sets.items():
+            device = self._devices.get(name)
+            if device is None:
+                request.results[name] = {"ok": False, "error": "Unknown device"}
+            elif action not in ACTIONS:
+                request.results[name] = {"ok": False, "error": "Invalid action"}
+            elif device.debounced:
+                request.results[name] = {"ok": device.set_binary_state(action)}
+            else:
+                self.start_call(request, blocking_calls, name, action)
+
+        for name in gets:
+            device = self._devices.get(name)
+            if name in request.results or name in sets:
+                continue
+            if device is None:
+                request.results[name] = {"ok": False, "error": "Unknown device"}
+            elif device.pending_action:
+                state = device.get_binary_state()
+                request.results[name] = {"ok": True, "state": state}
+            else:
+                self.start_call(request, blocking_calls, name, "get")
+
+        # Plugins bound to the event loop without non blocking calls can only
+        # be called one at a time
+        for name, call in blocking_calls:
+            if time.monotonic() >= request.deadline:
+                request.results[name] = {"ok": False, "error": "Timed out"}
+            elif call == "get":
+                state = self._devices[name].get_binary_state()
+                request.results[name] = {"ok": state in ACTIONS, "state": state}
+            else:
+                request.results[name] = {"ok": self._devices[name].perform_action(call)}
+
+        self._requests.append(request)
+        self.poll()
+        if self._requests and not self._poll_timer.isActive():
+            self._poll_timer.start(5)
+
+    def start_call(
+        self,
+        request: BulkRequest,
+        blocking_calls: List[Tuple[str, str]],
+        name: str,
+        call: str,
+    ):
+        device = self._devices[name]
+        future = device.start_plugin_call(call)
+        if future is None and device.plugin.THREAD_SAFE:
+            if call == "get":
+                future = self._executor.submit(device.read_plugin_state)
+            else:
+                future = self._executor.submit(device.perform_plugin_action, call)
+        if future is None:
+            blocking_calls.append((name, call))
+        else:
+            request.pending.append((name, call, future))
+
+    @pyqtSlot()
+    def poll(self):
+        now = time.monotonic()
+        for request in list(self._requests):
+            for name, call, future in list(request.pending):
+                if not future.done():
+                    continue
+                request.pending.remove((name, call, future))
+                result = self.call_result(name, call, future)
+                # Results of calls that finished after the deadline aren't
+                # reported but are still recorded
+                if request.socket is not None:
+                    request.results[name] = result
+
+            if request.socket is not None and (
+                not request.pending or now >= request.deadline
+            ):
+                for name, _, _ in request.pending:
+                    request.results[name] = {"ok": False, "error": "Timed out"}
+                self.respond(request.socket, 200, {"results": request.results})
+                request.socket = None
+
+            if request.socket is None and not request.pending:
+                self._requests.remove(request)
+
+        if not self._requests:
+            self._poll_timer.stop()
+
+    def call_result(self, name: str, call: str, future: Future) -> dict:
+        exception = future.exception()
+        if exception is not None:
+            logger.error(f"Management call {call} for {name} failed: {exception!r}")
+            return {"ok": False, "error": str(exception)}
+
+        if call == "get":
+            state = str(future.result()).casefold()
+            return {"ok": state in ACTIONS, "state": state}
+
+        success = future.result() is True
+        if success:
+            self._devices[name].action_performed(call)
+        return {"ok": success}
+
+    def respond(self, socket: QTcpSocket, status: int, payload: dict):
+        body = json.dumps(payload, separators=(",", ":"))
+        date_str = formatdate(timeval=None, localtime=False, usegmt=True)
+        response = NEW_LINE.join(
+            [
+                f"HTTP/1.1 {status} {HTTP_REASONS.get(status, '')}",
+                f'CONTENT-LENGTH: {len(body.encode("utf8"))}',
+                "CONTENT-TYPE: application/json",
+                f"DATE: {date_str}",
+                "SERVER: Jemo",
+                f"CONNECTION: close{NEW_LINE}",
+                f"{body}",
+            ]
+        )
+        socket.write(response.encode("utf8"))
+        socket.disconnectFromHost()
@@ -2,3 +2,4 @@ from .base import PluginBase
 from .command_line_plugin import CommandLinePlugin
 from .dummy_plugin import DummyPlugin
 from .http_plugin import HTTPPlugin
+from .mqtt_plugin import MQTTPlugin
@@ -1,24 +1,102 @@
+import time
 from abc import ABC, abstractmethod
-from typing import Callable
+from concurrent.futures import Future
+from typing import Callable, Optional
+
+from .. import logger
+
+ACTIONS = ("on", "off")
 
 
 class PluginBase(ABC):
+    # Whether on(), off() and get_state() may be called from threads other
+    # than the one running the Qt event loop, e.g. by the management API
+    THREAD_SAFE = False
+
+    __slots__ = (
+        "_name",
+        "_port",
+        "_latest_action",
+        "_latest_action_time",
+        "_last_result",
+        "_last_duration",
+        # Qt holds bound-method slots, e.g. authenticationRequired, by weakref
+        "__weakref__",
+    )
+
     def __init__(self, *, name: str, port: int) -> None:
         self._name = name
         self._port = port
         self._latest_action = "off"
+        self._latest_action_time: Optional[float] = None
+        self._last_result: Optional[bool] = None
+        self._last_duration: Optional[float] = None
+
+    def perform(self, action: str) -> bool:
+        # Plugins implement on() and off(), callers go through here so that the
+        # latest action, timing and outcome are recorded
+        if action == "on":
+            method = self.on
+        elif action == "off":
+            method = self.off
+        else:
+            raise ValueError(f"Unknown action '{action}'")
+
+        started = time.perf_counter()
+        try:
+            success = method() is True
+        except Exception:  # pylint:disable=broad-except
+            logger.exception(f"{self._name} failed to perform '{action}'")
+            success = False
+        self._record_result(action, success, started)
+        return success
+
+    def start_perform(self, action: str) -> "Optional[Future[bool]]":
+        # Non blocking perform() for plugins bound to the event loop, the future
+        # resolving on the loop. None if the plugin has no start_on()/start_off()
+        start_method: Callable[[], "Optional[Future[bool]]"]
+        if action == "on":
+            start_method = self.start_on
+        elif action == "off":
+            start_method = self.start_off
+        else:
+            raise ValueError(f"Unknown action '{action}'")
+
+        started = time.perf_counter()
+        future = start_method()
+        if future is None:
+            return None
+
+        def finished(done: "Future[bool]"):
+            exception = done.exception()
+            if exception is not None:
+                logger.error(f"{self._name} failed to perform '{action}': {exception}")
+            self._record_result(
+                action, exception is None and done.result() is True, started
+            )
+
+        future.add_done_callback(finished)
+        return future
 
-    def __getattribute__(self, name: str) -> Callable:
-        if name in ("on", "off"):
-            success = object.__getattribute__(self, name)()
-            if success is True:
-                self._latest_action = name
-            return lambda: success
-        return object.__getattribute__(self, name)
+    def _record_result(self, action: str, success: bool, started: float):
+        self._last_duration = time.perf_counter() - started
+        self._last_result = success
+        if success:
+            self._latest_action = action
+            self._latest_action_time = time.time()
 
     def __repr__(self) -> str:
-        attrs = ", ".join(f"{k}={v!r}" for k, v in self.__dict__.items())
-        return f"{self.__class__.__name__}({attrs}"
+        # Plugins use __slots__, though subclasses aren't required to
+        names = [
+            name
+            for cls in reversed(type(self).__mro__)
+            for name in cls.__dict__.get("__slots__", ())
+        ]
+        names.extend(getattr(self, "__dict__", {}))
+        attrs = ", ".join(
+            f"{name}={getattr(self, name)!r}" for name in names if hasattr(self, name)
+        )
+        return f"{self.__class__.__name__}({attrs})"
 
     @property
     def port(self) -> int:
@@ -39,9 +117,37 @@ class PluginBase(ABC):
     def get_state(self) -> str:
         return self._latest_action
 
+    # Plugins whose on(), off() or get_state() wait on the event loop may also
+    # offer these, returning a future resolved on the loop instead of blocking
+    def start_on(self) -> "Optional[Future[bool]]":
+        return None
+
+    def start_off(self) -> "Optional[Future[bool]]":
+        return None
+
+    def start_get_state(self) -> "Optional[Future[str]]":
+        return None
+
     def close(self) -> None:
         pass
 
     @property
     def latest_action(self) -> str:
         return self._latest_action
+
+    @property
+    def latest_action_time(self) -> Optional[float]:
+        return self._latest_action_time
+
+    @property
+    def last_result(self) -> Optional[bool]:
+        return self._last_result
+
+    @property
+    def last_duration(self) -> Optional[float]:
+        return self._last_duration
+
+    def restore_latest_action(self, action: str, timestamp: float) -> None:
+        if action in ACTIONS:
+            self._latest_action = action
+            self._latest_action_time = timestamp
@@ -22,6 +22,10 @@ from .base import PluginBase
 
 
 class CommandLinePlugin(PluginBase):
+    THREAD_SAFE = True
+
+    __slots__ = ("_on_cmd", "_off_cmd", "_state_cmd", "_use_fake_state")
+
     def __init__(
         self,
         name: str,
@@ -2,6 +2,10 @@ from .base import PluginBase
 
 
 class DummyPlugin(PluginBase):
+    THREAD_SAFE = True
+
+    __slots__ = ()
+
     def __init__(self, name: str, port: int):
         super().__init__(name=name, port=port)
 
@@ -1,5 +1,8 @@
+import json
+import re
 import urllib.parse
-from typing import Mapping, Optional, Union
+from concurrent.futures import Future
+from typing import Any, Dict, Mapping, Optional, Pattern, Tuple, Union
 
 from PyQt6.QtCore import QUrl
 from PyQt6.QtNetwork import (
@@ -16,8 +19,161 @@ from .base import PluginBase
 CommandData = Union[Mapping, str]
 OptionalCommandData = Optional[CommandData]
 
+DEFAULT_STATE_RESPONSE_MAX_BYTES = 64 * 1024
+# Regex matches may start this many bytes before the latest chunk
+STATE_RESPONSE_REGEX_OVERLAP = 1024
+
+
+def resolve_json_pointer(document: Any, pointer: str) -> Any:
+    if pointer in ("", "/"):
+        return document
+    if not pointer.startswith("/"):
+        raise ValueError(f"Invalid JSON pointer '{pointer}'")
+
+    value = document
+    for token in pointer[1:].split("/"):
+        token = token.replace("~1", "/").replace("~0", "~")
+        if isinstance(value, list):
+            value = value[int(token)]
+        else:
+            value = value[token]
+    return value
+
+
+# Matches a state response incrementally, as chunks arrive, so that reading can
+# stop as soon as a marker is found or max_bytes have been buffered. Markers are
+# substrings by default, regular expressions if regex is set, or the expected
+# values found at json_pointer (RFC 6901) in a JSON body.
+class StateResponseMatcher:  # pylint:disable=too-many-instance-attributes
+    __slots__ = (
+        "_response_on",
+        "_response_off",
+        "_max_bytes",
+        "_json_pointer",
+        "_patterns",
+        "_markers",
+        "_overlap",
+        "_buffer",
+        "_state",
+    )
+
+    def __init__(
+        self,
+        *,
+        response_on: Optional[str],
+        response_off: Optional[str],
+        max_bytes: int = DEFAULT_STATE_RESPONSE_MAX_BYTES,
+        regex: bool = False,
+        json_pointer: Optional[str] = None,
+    ):
+        self._response_on = response_on
+        self._response_off = response_off
+        self._max_bytes = max_bytes
+        self._json_pointer = json_pointer
+
+        self._patterns: Optional[Mapping[str, Pattern[bytes]]] = None
+        self._markers: Mapping[str, bytes] = {}
+        if regex:
+            self._patterns = {
+                state: re.compile(marker.encode("utf8"))
+                for state, marker in (("off", response_off), ("on", response_on))
+                if marker
+            }
+            self._overlap = STATE_RESPONSE_REGEX_OVERLAP
+        else:
+            self._markers = {
+                state: marker.encode("utf8")
+                for state, marker in (("off", response_off), ("on", response_on))
+                if marker
+            }
+            self._overlap = max((len(m) for m in self._markers.values()), default=1) - 1
+
+        self._buffer = bytearray()
+        self._state: Optional[str] = None
+
+    @property
+    def done(self) -> bool:
+        return self._state is not None or len(self._buffer) >= self._max_bytes
+
+    def feed(self, chunk: bytes) -> Optional[str]:
+        if self.done:
+            return self._state
+
+        start = max(0, len(self._buffer) - self._overlap)
+        self._buffer += chunk[: self._max_bytes - len(self._buffer)]
+
+        # JSON documents can only be evaluated once complete
+        if self._json_pointer is None:
+            self._state = self._search(start)
+        return self._state
+
+    def _search(self, start: int) -> Optional[str]:
+        # The marker whose first match ends earliest in the body wins (and
+        # "unknown" if both end at the same offset), so the result doesn't
+        # depend on how the body is split into chunks
+        ends: Dict[str, int] = {}
+        if self._patterns is not None:
+            for state, pattern in self._patterns.items():
+                match = pattern.search(self._buffer, start)
+                if match:
+                    ends[state] = match.end()
+        else:
+            for state, marker in self._markers.items():
+                index = self._buffer.find(marker, start)
+                if index != -1:
+                    ends[state] = index + len(marker)
+        if not ends:
+            return None
+
+        first_end = min(ends.values())
+        found = [state for state, end in ends.items() if end == first_end]
+        return found[0] if len(found) == 1 else "unknown"
+
+    def finish(self) -> str:
+        if self._state is None and self._json_pointer is not None:
+            self._state = self._extract_json()
+        return self._state or "unknown"
+
+    def _extract_json(self) -> str:
+        if self._json_pointer is None:
+            return "unknown"
+        try:
+            value = resolve_json_pointer(json.loads(self._buffer), self._json_pointer)
+        except (ValueError, KeyError, IndexError, TypeError) as exc:
+            logger.warning(f"Unable to extract '{self._json_pointer}': {exc!r}")
+            return "unknown"
+
+        if not isinstance(value, str):
+            value = json.dumps(value)
+        if value == self._response_off:
+            return "off"
+        if value == self._response_on:
+            return "on"
+        return "unknown"
+
 
 class HTTPPlugin(PluginBase):  # pylint:disable=too-many-instance-attributes
+    __slots__ = (
+        "_method",
+        "_state_method",
+        "_headers",
+        "_on_cmd",
+        "_on_data",
+        "_off_cmd",
+        "_off_data",
+        "_state_cmd",
+        "_state_data",
+        "_state_response_on",
+        "_state_response_off",
+        "_state_response_max_bytes",
+        "_state_response_regex",
+        "_state_response_json_pointer",
+        "_use_fake_state",
+        "_user",
+        "_password",
+        "_nam",
+    )
+
     def __init__(
         self,
         *,
@@ -31,8 +187,11 @@ class HTTPPlugin(PluginBase):  # pylint:disable=too-many-instance-attributes
         state_cmd: Optional[str] = None,
         state_data: OptionalCommandData = None,
         state_method: str = "GET",
+        state_response_json_pointer: Optional[str] = None,
+        state_response_max_bytes: int = DEFAULT_STATE_RESPONSE_MAX_BYTES,
         state_response_off: Optional[str] = None,
         state_response_on: Optional[str] = None,
+        state_response_regex: bool = False,
         password: Optional[str] = None,
         port: int,
         use_fake_state: bool = False,
@@ -54,12 +213,22 @@ class HTTPPlugin(PluginBase):  # pylint:disable=too-many-instance-attributes
         self._state_data = self._to_bytes(state_data) if state_data else None
         self._state_response_on = state_response_on
         self._state_response_off = state_response_off
+        self._state_response_max_bytes = state_response_max_bytes
+        self._state_response_regex = state_response_regex
+        self._state_response_json_pointer = state_response_json_pointer
+        if state_response_regex:
+            # Fail fast on invalid patterns rather than on the first poll
+            for pattern in (state_response_on, state_response_off):
+                if pattern:
+                    re.compile(pattern)
 
         self._use_fake_state = use_fake_state
 
         self._user = user
         self._password = password
 
+        # One manager per plugin: Qt allows only 6 connections per host and
+        # manager, so sharing one would serialise devices on the same backend
         self._nam = QNetworkAccessManager(
             authenticationRequired=self.authentication_required
         )  # type:ignore
@@ -72,20 +241,21 @@ class HTTPPlugin(PluginBase):  # pylint:disable=too-many-instance-attributes
             return data.encode("utf8")
         return data
 
-    def set_state(self, cmd: str, data: Optional[bytes]) -> bool:
+    def send_state(self, cmd: str, data: Optional[bytes]) -> QNetworkReply:
         request = QNetworkRequest(QUrl(cmd))
-        reply: QNetworkReply
+        reply: Optional[QNetworkReply]
         if self._method == "POST":
             reply = self._nam.post(request, data)  # type: ignore
         elif self._method == "GET":
             reply = self._nam.get(request)
         else:
             raise Exception(f"Method '{self._method}' not supported!")
+        assert reply is not None
+        return reply
 
-        while not reply.isFinished():
-            QApplication.processEvents()
-            continue
-
+    @staticmethod
+    def set_state_result(cmd: str, reply: QNetworkReply) -> bool:
+        reply.deleteLater()
         if reply.error() != QNetworkReply.NetworkError.NoError:
             logger.error(f"HTTPPlugin set_state cmd failed: {reply.errorString()}")
             return False
@@ -96,46 +266,94 @@ class HTTPPlugin(PluginBase):  # pylint:disable=too-many-instance-attributes
         logger.debug(f"Status code '{status_code}' for '{cmd}'")
         return status_code in (200, 201)
 
-    def get_state(self) -> str:
-        if self._use_fake_state:
-            return super().get_state()
+    def set_state(self, cmd: str, data: Optional[bytes]) -> bool:
+        reply = self.send_state(cmd, data)
+        while not reply.isFinished():
+            QApplication.processEvents()
+            continue
+        return self.set_state_result(cmd, reply)
 
-        if not (self._state_method and self._state_cmd):
-            return "unknown"
+    def start_set_state(self, cmd: str, data: Optional[bytes]) -> "Future[bool]":
+        future: "Future[bool]" = Future()
+        reply = self.send_state(cmd, data)
+        reply.finished.connect(
+            lambda: future.set_result(self.set_state_result(cmd, reply))
+        )
+        return future
 
+    def request_state(self) -> Tuple[QNetworkReply, StateResponseMatcher]:
         logger.debug(
             f"HTTPPlugin get_state cmd: {self._state_method} {self._state_cmd}"
         )
         request = QNetworkRequest(QUrl(self._state_cmd))
-        reply: QNetworkReply
+        reply: Optional[QNetworkReply]
         if self._state_method == "POST":
             reply = self._nam.post(request, self._state_data)  # type:ignore
         elif self._state_method == "GET":
             reply = self._nam.get(request)
         else:
             raise Exception(f"Method '{self._method}' not supported!")
+        assert reply is not None
+
+        matcher = StateResponseMatcher(
+            response_on=self._state_response_on,
+            response_off=self._state_response_off,
+            max_bytes=self._state_response_max_bytes,
+            regex=self._state_response_regex,
+            json_pointer=self._state_response_json_pointer,
+        )
+
+        def read_chunk():
+            if matcher.done:
+                return
+            matcher.feed(reply.readAll().data())
+            if matcher.done:
+                logger.debug("State response matched or limit reached, aborting")
+                reply.abort()
+
+        reply.readyRead.connect(read_chunk)
+        return reply, matcher
+
+    @staticmethod
+    def state_result(reply: QNetworkReply, matcher: StateResponseMatcher) -> str:
+        # Replies are only aborted once the matcher is done
+        if not matcher.done:
+            if reply.error() != QNetworkReply.NetworkError.NoError:
+                logger.error(f"HTTPPlugin get_state cmd failed: {reply.errorString()}")
+            matcher.feed(reply.readAll().data())
+        reply.deleteLater()
+
+        state = matcher.finish()
+        logger.debug(f"HTTPPlugin get state response matched: {state}")
+        return state
 
+    def get_state(self) -> str:
+        if self._use_fake_state:
+            return super().get_state()
+
+        if not (self._state_method and self._state_cmd):
+            return "unknown"
+
+        reply, matcher = self.request_state()
         logger.debug("Wait for reply to finish...")
         while not reply.isFinished():
             QApplication.processEvents()
             continue
         logger.debug("...finished!")
+        return self.state_result(reply, matcher)
 
-        if reply.error() != QNetworkReply.NetworkError.NoError:
-            logger.error(f"HTTPPlugin get_state cmd failed: {reply.errorString()}")
-        content = reply.readAll().data().decode("utf8")
-        logger.debug(f"HTTPPlugin get state response content: {content}")
-        has_response_off = (
-            self._state_response_off and self._state_response_off in content
-        )
-        has_response_on = self._state_response_on and self._state_response_on in content
-        if has_response_off == has_response_on:
-            return "unknown"
-        if has_response_off:
-            return "off"
-        if has_response_on:
-            return "on"
-        return "unknown"
+    def start_get_state(self) -> "Future[str]":
+        future: "Future[str]" = Future()
+        if self._use_fake_state:
+            future.set_result(super().get_state())
+        elif not (self._state_method and self._state_cmd):
+            future.set_result("unknown")
+        else:
+            reply, matcher = self.request_state()
+            reply.finished.connect(
+                lambda: future.set_result(self.state_result(reply, matcher))
+            )
+        return future
 
     def on(self) -> bool:
         return self.set_state(self._on_cmd, self._on_data)
@@ -143,6 +361,12 @@ class HTTPPlugin(PluginBase):  # pylint:disable=too-many-instance-attributes
     def off(self) -> bool:
         return self.set_state(self._off_cmd, self._off_data)
 
+    def start_on(self) -> "Future[bool]":
+        return self.start_set_state(self._on_cmd, self._on_data)
+
+    def start_off(self) -> "Future[bool]":
+        return self.start_set_state(self._off_cmd, self._off_data)
+
     def authentication_required(self, _, authenticator: QAuthenticator):
         if self._user:
             authenticator.setUser(self._user)
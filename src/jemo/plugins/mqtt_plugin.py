@@ -0,0 +1,533 @@
+import json
+import struct
+import time
+import uuid
+from concurrent.futures import Future
+from typing import Callable, Dict, List, Optional, Tuple, Union
+
+from PyQt6.QtCore import QObject, QTimer, pyqtSlot
+from PyQt6.QtNetwork import QAbstractSocket, QTcpSocket
+from PyQt6.QtWidgets import QApplication
+
+from .. import logger
+from .base import PluginBase
+from .http_plugin import resolve_json_pointer
+
+# MQTT 3.1.1 control packet types
+CONNECT = 1
+CONNACK = 2
+PUBLISH = 3
+PUBACK = 4
+SUBSCRIBE = 8
+SUBACK = 9
+PINGREQ = 12
+PINGRESP = 13
+DISCONNECT = 14
+
+CONNACK_ERRORS = {
+    1: "unacceptable protocol version",
+    2: "identifier rejected",
+    3: "server unavailable",
+    4: "bad user name or password",
+    5: "not authorized",
+}
+
+MessageCallback = Callable[[str, bytes], None]
+
+
+def encode_string(value: Union[str, bytes]) -> bytes:
+    data = value.encode("utf8") if isinstance(value, str) else value
+    return struct.pack("!H", len(data)) + data
+
+
+def encode_packet(packet_type: int, flags: int, body: bytes = b"") -> bytes:
+    header = bytearray([packet_type << 4 | flags])
+    length = len(body)
+    while True:
+        length, byte = divmod(length, 128)
+        header.append(byte | 0x80 if length else byte)
+        if not length:
+            break
+    return bytes(header) + body
+
+
+def decode_packet(buffer: bytearray) -> Optional[Tuple[int, int, bytes]]:
+    # Removes and returns the first complete packet in buffer as (type, flags,
+    # body), or None if more data is needed
+    length, multiplier, index = 0, 1, 1
+    while True:
+        if index >= len(buffer):
+            return None
+        byte = buffer[index]
+        length += (byte & 0x7F) * multiplier
+        multiplier *= 128
+        index += 1
+        if not byte & 0x80:
+            break
+        if index > 4:
+            raise ValueError("Malformed MQTT remaining length")
+
+    end = index + length
+    if len(buffer) < end:
+        return None
+    packet_type, flags = buffer[0] >> 4, buffer[0] & 0x0F
+    body = bytes(buffer[index:end])
+    del buffer[:end]
+    return packet_type, flags, body
+
+
+def encode_publish(
+    topic: str, payload: bytes, qos: int = 0, retain: bool = False, packet_id: int = 0
+) -> bytes:
+    body = encode_string(topic)
+    if qos:
+        body += struct.pack("!H", packet_id)
+    return encode_packet(PUBLISH, qos << 1 | int(retain), body + payload)
+
+
+def decode_publish(flags: int, body: bytes) -> Tuple[str, bytes, int, int]:
+    # Returns (topic, payload, qos, packet id)
+    qos = (flags >> 1) & 0x03
+    (topic_length,) = struct.unpack_from("!H", body)
+    topic = body[2 : 2 + topic_length].decode("utf8")
+    index = 2 + topic_length
+    packet_id = 0
+    if qos:
+        (packet_id,) = struct.unpack_from("!H", body, index)
+        index += 2
+    return topic, body[index:], qos, packet_id
+
+
+def topic_matches(topic_filter: str, topic: str) -> bool:
+    filter_levels = topic_filter.split("/")
+    topic_levels = topic.split("/")
+    for index, level in enumerate(filter_levels):
+        if level == "#":
+            return True
+        if index >= len(topic_levels):
+            return False
+        if level not in ("+", topic_levels[index]):
+            return False
+    return len(filter_levels) == len(topic_levels)
+
+
+class MQTTClient(QObject):  # pylint:disable=too-many-instance-attributes
+    # A minimal MQTT 3.1.1 client on the Qt event loop: QoS 0 and 1, clean
+    # sessions, keep alive pings and reconnection with exponential backoff.
+    # Subscriptions are renewed on every reconnect, which also redelivers
+    # retained messages.
+    _shared: Dict[Tuple[str, int, Optional[str], Optional[str]], "MQTTClient"] = {}
+
+    def __init__(
+        self,
+        host: str,
+        port: int = 1883,
+        *,
+        client_id: Optional[str] = None,
+        username: Optional[str] = None,
+        password: Optional[str] = None,
+        keepalive: int = 60,
+        reconnect_min_delay: float = 1.0,
+        reconnect_max_delay: float = 60.0,
+        parent=None,
+        **kwargs,
+    ):  # pylint:disable=too-many-arguments
+        super().__init__(parent, **kwargs)
+
+        self._host = host
+        self._port = port
+        self._client_id = client_id or f"jemo-{uuid.uuid4().hex[:12]}"
+        self._username = username
+        self._password = password
+        self._keepalive = keepalive
+        self._reconnect_min_delay = reconnect_min_delay
+        self._reconnect_max_delay = reconnect_max_delay
+        self._reconnect_delay = reconnect_min_delay
+
+        self._connected = False
+        self._closing = False
+        self._buffer = bytearray()
+        self._last_received = 0.0
+        self._next_packet_id = 0
+        # QoS 1 publishes waiting for a PUBACK, by packet id
+        self._inflight: Dict[int, "Future[bool]"] = {}
+        self._subscriptions: Dict[str, Tuple[int, List[MessageCallback]]] = {}
+
+        self._socket = QTcpSocket(
+            self,
+            connected=self.socket_connected,
+            stateChanged=self.socket_state_changed,
+            errorOccurred=self.socket_error,
+            readyRead=self.read_data,
+        )  # type:ignore
+        self._reconnect_timer = QTimer(
+            self, singleShot=True, timeout=self.connect_to_broker
+        )  # type:ignore
+        self._ping_timer = QTimer(self, timeout=self.ping)  # type:ignore
+
+    @classmethod
+    def shared(
+        cls,
+        host: str,
+        port: int = 1883,
+        *,
+        client_id: Optional[str] = None,
+        username: Optional[str] = None,
+        **kwargs,
+    ) -> "MQTTClient":
+        # One connection per broker (and client id/user) for all devices, the
+        # options of the first device to ask for it are used
+        key = (host, port, client_id, username)
+        client = cls._shared.get(key)
+        if client is None:
+            client = cls(host, port, client_id=client_id, username=username, **kwargs)
+            cls._shared[key] = client
+            client.connect_to_broker()
+        return client
+
+    @property
+    def is_connected(self) -> bool:
+        return self._connected
+
+    @pyqtSlot()
+    def connect_to_broker(self):
+        if self._socket.state() != QAbstractSocket.SocketState.UnconnectedState:
+            return
+        logger.debug(f"Connecting to MQTT broker {self._host}:{self._port}")
+        self._buffer.clear()
+        self._socket.connectToHost(self._host, self._port)
+
+    def disconnect_from_broker(self):
+        self._closing = True
+        self._reconnect_timer.stop()
+        self._ping_timer.stop()
+        if self._connected:
+            self._socket.write(encode_packet(DISCONNECT, 0))
+        self._connected = False
+        self._socket.disconnectFromHost()
+
+    @pyqtSlot()
+    def socket_connected(self):
+        self._last_received = time.monotonic()
+        flags = 0x02  # Clean session
+        payload = encode_string(self._client_id)
+        if self._username is not None:
+            flags |= 0x80
+            payload += encode_string(self._username)
+            if self._password is not None:
+                flags |= 0x40
+                payload += encode_string(self._password)
+        body = (
+            encode_string("MQTT")
+            + bytes([4, flags])
+            + struct.pack("!H", self._keepalive)
+        )
+        self._socket.write(encode_packet(CONNECT, 0, body + payload))
+
+    @pyqtSlot(QAbstractSocket.SocketState)
+    def socket_state_changed(self, state: QAbstractSocket.SocketState):
+        if state != QAbstractSocket.SocketState.UnconnectedState:
+            return
+        if self._connected:
+            logger.warning(f"Disconnected from MQTT broker {self._host}:{self._port}")
+        self._connected = False
+        self._ping_timer.stop()
+        # QoS 1 publishes aren't retried on a clean session, so those still
+        # in flight have failed
+        inflight, self._inflight = self._inflight, {}
+        for future in inflight.values():
+            future.set_result(False)
+        self.schedule_reconnect()
+
+    @pyqtSlot(QAbstractSocket.SocketError)
+    def socket_error(self, _):
+        logger.warning(
+            f"MQTT broker {self._host}:{self._port} error: "
+            f"{self._socket.errorString()}"
+        )
+
+    def schedule_reconnect(self):
+        if self._closing or self._reconnect_timer.isActive():
+            return
+        logger.info(f"Reconnecting to MQTT broker in {self._reconnect_delay:.1f}s")
+        self._reconnect_timer.start(int(self._reconnect_delay * 1000))
+        self._reconnect_delay = min(
+            self._reconnect_delay * 2, self._reconnect_max_delay
+        )
+
+    @pyqtSlot()
+    def ping(self):
+        # Nothing, not even a PINGRESP, heard from the broker for too long
+        if time.monotonic() - self._last_received > 1.5 * self._keepalive:
+            logger.warning("MQTT broker stopped responding, reconnecting")
+            self._socket.abort()
+            return
+        self._socket.write(encode_packet(PINGREQ, 0))
+
+    @pyqtSlot()
+    def read_data(self):
+        self._buffer += self._socket.readAll().data()
+        self._last_received = time.monotonic()
+        try:
+            while True:
+                packet = decode_packet(self._buffer)
+                if packet is None:
+                    break
+                self.handle_packet(*packet)
+        except (ValueError, IndexError, struct.error, UnicodeDecodeError) as exc:
+            logger.error(f"Invalid packet from MQTT broker: {exc}")
+            self._socket.abort()
+
+    def handle_packet(self, packet_type: int, flags: int, body: bytes):
+        if packet_type == CONNACK:
+            return_code = body[1]
+            if return_code:
+                error = CONNACK_ERRORS.get(return_code, return_code)
+                logger.error(f"MQTT broker refused connection: {error}")
+                self._socket.disconnectFromHost()
+                return
+            logger.info(f"Connected to MQTT broker {self._host}:{self._port}")
+            self._connected = True
+            self._reconnect_delay = self._reconnect_min_delay
+            if self._keepalive:
+                self._ping_timer.start(self._keepalive * 1000)
+            if self._subscriptions:
+                self.send_subscribe(list(self._subscriptions))
+        elif packet_type == PUBLISH:
+            topic, payload, qos, packet_id = decode_publish(flags, body)
+            if qos:
+                self._socket.write(
+                    encode_packet(PUBACK, 0, struct.pack("!H", packet_id))
+                )
+            self.dispatch(topic, payload)
+        elif packet_type == PUBACK:
+            future = self._inflight.pop(struct.unpack("!H", body[:2])[0], None)
+            if future is not None:
+                future.set_result(True)
+        elif packet_type == SUBACK:
+            if 0x80 in body[2:]:
+                logger.error("MQTT broker rejected a subscription")
+
+    def dispatch(self, topic: str, payload: bytes):
+        logger.debug(f"MQTT message on {topic}: {payload[:64]!r}")
+        for topic_filter, (_, callbacks) in self._subscriptions.items():
+            if topic_matches(topic_filter, topic):
+                for callback in callbacks:
+                    callback(topic, payload)
+
+    def packet_id(self) -> int:
+        self._next_packet_id = self._next_packet_id % 0xFFFF + 1
+        return self._next_packet_id
+
+    def send_subscribe(self, topic_filters: List[str]):
+        body = struct.pack("!H", self.packet_id())
+        for topic_filter in topic_filters:
+            qos = self._subscriptions[topic_filter][0]
+            body += encode_string(topic_filter) + bytes([qos])
+        self._socket.write(encode_packet(SUBSCRIBE, 0x02, body))
+
+    def subscribe(self, topic_filter: str, callback: MessageCallback, qos: int = 0):
+        if topic_filter in self._subscriptions:
+            current_qos, callbacks = self._subscriptions[topic_filter]
+            callbacks.append(callback)
+            if qos <= current_qos:
+                return
+        else:
+            callbacks = [callback]
+        self._subscriptions[topic_filter] = (qos, callbacks)
+        if self._connected:
+            self.send_subscribe([topic_filter])
+
+    def remove_callback(self, callback: MessageCallback):
+        for _, callbacks in self._subscriptions.values():
+            if callback in callbacks:
+                callbacks.remove(callback)
+
+    def publish(
+        self, topic: str, payload: bytes, qos: int = 0, retain: bool = False
+    ) -> Optional["Future[bool]"]:
+        # Returns None if not connected, otherwise a future that is resolved on
+        # the event loop: at once for QoS 0, and for QoS 1 with True on PUBACK
+        # or False if the connection is lost first
+        if not self._connected:
+            return None
+        future: "Future[bool]" = Future()
+        packet_id = 0
+        if qos:
+            packet_id = self.packet_id()
+            self._inflight[packet_id] = future
+        self._socket.write(encode_publish(topic, payload, qos, retain, packet_id))
+        if not qos:
+            future.set_result(True)
+        return future
+
+
+# Example:
+# MQTTPlugin(
+#   name="Lamp",
+#   port=8125,
+#   broker_host="192.168.1.10",
+#   command_topic="zigbee2mqtt/lamp/set",
+#   state_topic="zigbee2mqtt/lamp",
+#   state_json_pointer="/state",
+#   qos=1
+# )
+
+
+class MQTTPlugin(PluginBase):  # pylint:disable=too-many-instance-attributes
+    # Publishes on/off payloads on a broker connection shared by all devices
+    # and keeps the state from the (retained) messages on state_topic, so that
+    # get_state never waits on the network
+    __slots__ = (
+        "_client",
+        "_command_topic",
+        "_state_topic",
+        "_payload_on",
+        "_payload_off",
+        "_state_payload_on",
+        "_state_payload_off",
+        "_state_json_pointer",
+        "_qos",
+        "_retain",
+        "_timeout",
+        "_state",
+    )
+
+    def __init__(
+        self,
+        *,
+        broker_host: str,
+        broker_port: int = 1883,
+        client_id: Optional[str] = None,
+        command_topic: str,
+        keepalive: int = 60,
+        name: str,
+        password: Optional[str] = None,
+        payload_off: str = "OFF",
+        payload_on: str = "ON",
+        port: int,
+        qos: int = 0,
+        reconnect_max_delay: float = 60.0,
+        reconnect_min_delay: float = 1.0,
+        retain: bool = False,
+        state_json_pointer: Optional[str] = None,
+        state_payload_off: Optional[str] = None,
+        state_payload_on: Optional[str] = None,
+        state_topic: Optional[str] = None,
+        timeout: float = 5.0,
+        username: Optional[str] = None,
+    ):  # pylint:disable=too-many-arguments,too-many-locals
+        super().__init__(name=name, port=port)
+
+        if qos not in (0, 1):
+            raise ValueError(f"MQTTPlugin qos must be 0 or 1, not {qos}")
+
+        self._command_topic = command_topic
+        self._state_topic = state_topic
+        self._payload_on = payload_on.encode("utf8")
+        self._payload_off = payload_off.encode("utf8")
+        self._state_payload_on = (
+            state_payload_on if state_payload_on is not None else payload_on
+        )
+        self._state_payload_off = (
+            state_payload_off if state_payload_off is not None else payload_off
+        )
+        self._state_json_pointer = state_json_pointer
+        self._qos = qos
+        self._retain = retain
+        self._timeout = timeout
+        self._state = "unknown"
+
+        self._client = MQTTClient.shared(
+            broker_host,
+            broker_port,
+            client_id=client_id,
+            username=username,
+            password=password,
+            keepalive=keepalive,
+            reconnect_min_delay=reconnect_min_delay,
+            reconnect_max_delay=reconnect_max_delay,
+        )
+        if state_topic:
+            self._client.subscribe(state_topic, self.state_received, qos)
+
+    def state_received(self, topic: str, payload: bytes):
+        try:
+            value = payload.decode("utf8").strip()
+            if self._state_json_pointer is not None:
+                value = resolve_json_pointer(
+                    json.loads(value), self._state_json_pointer
+                )
+                # Match HTTPPlugin: non-strings are compared in their JSON form
+                if not isinstance(value, str):
+                    value = json.dumps(value)
+        except (ValueError, KeyError, IndexError, TypeError) as exc:
+            logger.debug(f"MQTTPlugin {self.name} ignored message on {topic}: {exc}")
+            return
+
+        if value == self._state_payload_on:
+            self._state = "on"
+        elif value == self._state_payload_off:
+            self._state = "off"
+        else:
+            logger.debug(f"MQTTPlugin {self.name} unknown state '{value}' on {topic}")
+
+    def wait_for(self, condition: Callable[[], bool]) -> bool:
+        deadline = time.monotonic() + self._timeout
+        while not condition():
+            if time.monotonic() >= deadline:
+                return False
+            QApplication.processEvents()
+        return True
+
+    def publish(self, payload: bytes) -> bool:
+        client = self._client
+        if not self.wait_for(lambda: client.is_connected):
+            logger.error(f"MQTTPlugin {self.name} not connected to the broker")
+            return False
+
+        future = client.publish(
+            self._command_topic, payload, qos=self._qos, retain=self._retain
+        )
+        if future is None:
+            return False
+        if not self.wait_for(future.done):
+            logger.error(f"MQTTPlugin {self.name} publish not acknowledged")
+            return False
+        return future.result()
+
+    def start_publish(self, payload: bytes) -> "Future[bool]":
+        future = self._client.publish(
+            self._command_topic, payload, qos=self._qos, retain=self._retain
+        )
+        if future is None:
+            logger.error(f"MQTTPlugin {self.name} not connected to the broker")
+            future = Future()
+            future.set_result(False)
+        return future
+
+    def on(self) -> bool:
+        return self.publish(self._payload_on)
+
+    def off(self) -> bool:
+        return self.publish(self._payload_off)
+
+    def start_on(self) -> "Future[bool]":
+        return self.start_publish(self._payload_on)
+
+    def start_off(self) -> "Future[bool]":
+        return self.start_publish(self._payload_off)
+
+    def start_get_state(self) -> "Future[str]":
+        future: "Future[str]" = Future()
+        future.set_result(self.get_state())
+        return future
+
+    def get_state(self) -> str:
+        # Without a state topic the latest action is assumed to have worked
+        if not self._state_topic:
+            return super().get_state()
+        return self._state
+
+    def close(self) -> None:
+        self._client.remove_callback(self.state_received)
@@ -1,11 +1,15 @@
 import argparse
 import json
+import random
 import re
+import signal
 import sys
+import time
 from email.utils import formatdate
-from typing import Optional
+from functools import partial
+from typing import Callable, Dict, List, Optional, Tuple
 
-from PyQt6.QtCore import QObject, pyqtSlot
+from PyQt6.QtCore import QObject, QTimer, pyqtSlot
 from PyQt6.QtNetwork import QHostAddress, QTcpServer, QTcpSocket
 from PyQt6.QtWidgets import QApplication
 
@@ -14,16 +18,50 @@ from .. import logger
 NEW_LINE = "\r\n"
 HTTP_REQUEST_RE = re.compile(
     r"^(?P<method>GET|POST)\s+(?P<path>([^?\s]+)((?:[?&][^&\s]+)*))\s+"
+    r"(?P<version>HTTP/1\.[01])"
 )
+HTTP_REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 500: "Server Error"}
 
 
-class SimpleHTTPServer(QObject):
-    def __init__(self, parent=None, **kwargs):
+class Connection:  # pylint:disable=too-few-public-methods
+    __slots__ = ("buffer", "busy")
+
+    def __init__(self) -> None:
+        self.buffer = bytearray()
+        self.busy = False
+
+
+class SimpleHTTPServer(QObject):  # pylint:disable=too-many-instance-attributes
+    # A mock backend for HTTPPlugin. Each device id has its own state, e.g.
+    # POST /on/<id>, POST /off/<id> and GET /status/<id>, with the id being
+    # optional. Connections are kept alive unless the client asks otherwise
+    # and responses can be delayed, failed or padded to exercise clients.
+    def __init__(
+        self,
+        parent=None,
+        *,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        error_rate: float = 0.0,
+        response_size: int = 0,
+        padding_first: bool = False,
+        **kwargs,
+    ):  # pylint:disable=too-many-arguments
         super().__init__(parent, **kwargs)
 
         self._server: Optional[QTcpServer] = None
-        self._sockets = []
-        self._status = "off"
+        self._sockets: Dict[QTcpSocket, Connection] = {}
+        self._states: Dict[str, str] = {}
+
+        self._latency = latency
+        self._jitter = jitter
+        self._error_rate = error_rate
+        self._response_size = response_size
+        self._padding_first = padding_first
+
+        self._route_counts: Dict[str, int] = {}
+        self._status_counts: Dict[int, int] = {}
+        self._latencies: List[float] = []
 
     def start_server(self, ip_address: str, port: int):
         self._server = QTcpServer(
@@ -36,60 +74,152 @@ class SimpleHTTPServer(QObject):
 
     @pyqtSlot()
     def new_connection(self):
-        socket: QTcpSocket = self._server.nextPendingConnection()
-        socket.readyRead.connect(self.read_data)
-        socket.disconnected.connect(self.remove_socket)
-        self._sockets.append(socket)
+        while self._server.hasPendingConnections():
+            socket: QTcpSocket = self._server.nextPendingConnection()
+            socket.readyRead.connect(self.read_data)
+            socket.disconnected.connect(self.remove_socket)
+            self._sockets[socket] = Connection()
 
     @pyqtSlot()
     def read_data(self):
         socket: QTcpSocket = self.sender()
-        message = socket.readAll().data().decode("utf8")
+        connection = self._sockets.get(socket)
+        if connection is None:
+            return
+        connection.buffer += socket.readAll().data()
+        self.process_requests(socket)
+
+    def process_requests(self, socket: QTcpSocket):
+        connection = self._sockets.get(socket)
+        # Requests on a connection are answered in order, one at a time
+        if connection is None or connection.busy:
+            return
+
+        request = self.next_request(connection)
+        if request is None:
+            return
+        connection.busy = True
+        received = time.perf_counter()
+
+        message, keep_alive = request
+        status, route, response = self.route(message)
+        self._route_counts[route] = self._route_counts.get(route, 0) + 1
+
+        delay = max(0.0, self._latency + random.uniform(-self._jitter, self._jitter))
+        QTimer.singleShot(
+            int(delay),
+            partial(self.respond, socket, status, response, keep_alive, received),
+        )
+
+    @staticmethod
+    def next_request(connection: Connection) -> Optional[Tuple[str, bool]]:
+        header_end = connection.buffer.find(b"\r\n\r\n")
+        if header_end == -1:
+            return None
+        head = connection.buffer[:header_end].decode("utf8", errors="replace")
 
+        request_line, *header_lines = head.split(NEW_LINE)
+        content_length = 0
+        keep_alive = not request_line.endswith("HTTP/1.0")
+        for line in header_lines:
+            key, _, value = line.partition(":")
+            key = key.strip().lower()
+            if key == "content-length" and value.strip().isdigit():
+                content_length = int(value)
+            elif key == "connection":
+                keep_alive = value.strip().lower() == "keep-alive"
+
+        request_end = header_end + 4 + content_length
+        if len(connection.buffer) < request_end:
+            return None
+        del connection.buffer[:request_end]
+        return head, keep_alive
+
+    def route(self, message: str) -> Tuple[int, str, Optional[dict]]:
         match = HTTP_REQUEST_RE.match(message)
-        if match:
-            method = match.group("method")
-
-            path = match.group("path")
-            name = f"route_{method.lower()}_{path.split('/',2)[1]}"
-            try:
-                response = getattr(self, name)()
-                json_response = json.dumps(response, separators=(",", ":"))
-                http_response = self.make_http_response(json_response)
-                socket.write(http_response.encode("utf8"))
-                socket.waitForBytesWritten()
-            except Exception as exc:  # pylint:disable=broad-except
-                logger.debug(f"{exc}")
-
-        socket.close()
-
-    def route_post_on(self):
-        logger.debug("Status ON")
-        self._status = "on"
-        return {"status": self._status}
-
-    def route_post_off(self):
-        logger.debug("Status OFF")
-        self._status = "off"
-        return {"status": self._status}
-
-    def route_get_status(self):
-        logger.debug("Status GET")
-        return {"status": self._status}
+        if not match:
+            return 400, "invalid", None
+
+        method = match.group("method")
+        path = match.group("path").split("?", 1)[0]
+        _, route, device_id = (path.split("/", 2) + ["", ""])[:3]
+        route_name = f"{method} /{route}"
+
+        handler: Optional[Callable[[str], dict]] = getattr(
+            self, f"route_{method.lower()}_{route}", None
+        )
+        if handler is None:
+            return 404, route_name, None
+        if random.random() < self._error_rate:
+            return 500, route_name, None
+        return 200, route_name, handler(device_id.strip("/"))
+
+    def respond(
+        self,
+        socket: QTcpSocket,
+        status: int,
+        response: Optional[dict],
+        keep_alive: bool,
+        received: float,
+    ):  # pylint:disable=too-many-arguments
+        connection = self._sockets.get(socket)
+        if connection is None:
+            return
+
+        body = self.make_body(response) if response is not None else ""
+        socket.write(self.make_http_response(body, status, keep_alive).encode("utf8"))
+
+        self._latencies.append(time.perf_counter() - received)
+        self._status_counts[status] = self._status_counts.get(status, 0) + 1
+
+        connection.busy = False
+        if keep_alive:
+            self.process_requests(socket)
+        else:
+            # Closes once any pending data has been written
+            socket.disconnectFromHost()
+
+    def make_body(self, response: dict) -> str:
+        if self._response_size > 0:
+            padding = {"padding": "x" * self._response_size}
+            if self._padding_first:
+                response = {**padding, **response}
+            else:
+                response = {**response, **padding}
+        return json.dumps(response, separators=(",", ":"))
+
+    def route_post_on(self, device_id: str):
+        logger.debug(f"Status ON {device_id}")
+        self._states[device_id] = "on"
+        return {"status": "on"}
+
+    def route_post_off(self, device_id: str):
+        logger.debug(f"Status OFF {device_id}")
+        self._states[device_id] = "off"
+        return {"status": "off"}
+
+    route_get_on = route_post_on
+    route_get_off = route_post_off
+
+    def route_get_status(self, device_id: str):
+        logger.debug(f"Status GET {device_id}")
+        return {"status": self._states.get(device_id, "off")}
 
     @staticmethod
-    def make_http_response(response: str) -> str:
+    def make_http_response(
+        response: str, status: int = 200, keep_alive: bool = False
+    ) -> str:
         date_str = formatdate(timeval=None, localtime=False, usegmt=True)
         return NEW_LINE.join(
             [
-                "HTTP/1.1 200 OK",
+                f"HTTP/1.1 {status} {HTTP_REASONS.get(status, '')}",
                 f'CONTENT-LENGTH: {len(response.encode("utf8"))}',
                 "CONTENT-TYPE: application/json",
                 f"DATE: {date_str}",
                 "LAST-MODIFIED: Sat, 01 Jan 2000 00:01:15 GMT",
                 "SERVER: Unspecified, UPnP/1.0, Unspecified",
                 "X-User-Agent: Jemo",
-                f"CONNECTION: close{NEW_LINE}",
+                f"CONNECTION: {'keep-alive' if keep_alive else 'close'}{NEW_LINE}",
                 f"{response}",
             ]
         )
@@ -97,14 +227,64 @@ class SimpleHTTPServer(QObject):
     @pyqtSlot()
     def remove_socket(self):
         socket: QTcpSocket = self.sender()
-        self._sockets.remove(socket)
+        self._sockets.pop(socket, None)
         socket.deleteLater()
 
+    def summary(self) -> str:
+        lines = [f"Requests: {len(self._latencies)}"]
+        lines.extend(
+            f"  {route}: {count}" for route, count in sorted(self._route_counts.items())
+        )
+        lines.extend(
+            f"  HTTP {status}: {count}"
+            for status, count in sorted(self._status_counts.items())
+        )
+        if self._latencies:
+            latencies = sorted(self._latencies)
+
+            def percentile(fraction: float) -> float:
+                index = min(len(latencies) - 1, int(fraction * len(latencies)))
+                return latencies[index] * 1000
+
+            lines.append(
+                "Latency (ms): "
+                f"min {latencies[0] * 1000:.2f}, "
+                f"mean {sum(latencies) / len(latencies) * 1000:.2f}, "
+                f"p50 {percentile(0.5):.2f}, "
+                f"p95 {percentile(0.95):.2f}, "
+                f"p99 {percentile(0.99):.2f}, "
+                f"max {latencies[-1] * 1000:.2f}"
+            )
+        return NEW_LINE.join(lines)
+
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="SimpleHTTPServer")
     parser.add_argument("-H", "--host", required=True)
     parser.add_argument("-p", "--port", type=int, required=True)
+    parser.add_argument(
+        "--latency", type=float, default=0.0, help="Response delay in ms"
+    )
+    parser.add_argument(
+        "--jitter", type=float, default=0.0, help="Random +/- delay in ms"
+    )
+    parser.add_argument(
+        "--error-rate",
+        type=float,
+        default=0.0,
+        help="Fraction of requests answered with HTTP 500",
+    )
+    parser.add_argument(
+        "--response-size",
+        type=int,
+        default=0,
+        help="Pad JSON responses with this many bytes",
+    )
+    parser.add_argument(
+        "--padding-first",
+        action="store_true",
+        help="Place the padding before the status in responses",
+    )
     parser.add_argument(
         "-v",
         "--verbose",
@@ -119,6 +299,21 @@ if __name__ == "__main__":
     logger.setLevel(verbosity)
 
     a = QApplication(sys.argv)
-    s = SimpleHTTPServer()
+    s = SimpleHTTPServer(
+        latency=args.latency,
+        jitter=args.jitter,
+        error_rate=args.error_rate,
+        response_size=args.response_size,
+        padding_first=args.padding_first,
+    )
     s.start_server(args.host, args.port)
-    sys.exit(a.exec())
+
+    signal.signal(signal.SIGINT, lambda *_: a.quit())
+    signal.signal(signal.SIGTERM, lambda *_: a.quit())
+    # Gives the interpreter a chance to run the signal handlers
+    signal_timer = QTimer(timeout=lambda: None)  # type:ignore
+    signal_timer.start(200)
+
+    exit_code = a.exec()
+    print(s.summary())
+    sys.exit(exit_code)
@@ -0,0 +1,216 @@
+import argparse
+import signal
+import struct
+import sys
+from typing import Dict, List, Optional, Set
+
+from PyQt6.QtCore import QObject, QTimer, pyqtSlot
+from PyQt6.QtNetwork import QHostAddress, QTcpServer, QTcpSocket
+from PyQt6.QtWidgets import QApplication
+
+from .. import logger
+from ..plugins.mqtt_plugin import (
+    CONNACK,
+    CONNECT,
+    DISCONNECT,
+    PINGREQ,
+    PINGRESP,
+    PUBACK,
+    PUBLISH,
+    SUBACK,
+    SUBSCRIBE,
+    decode_packet,
+    decode_publish,
+    encode_packet,
+    encode_publish,
+    topic_matches,
+)
+
+
+class Session:  # pylint:disable=too-few-public-methods
+    __slots__ = ("buffer", "client_id", "subscriptions", "next_packet_id")
+
+    def __init__(self) -> None:
+        self.buffer = bytearray()
+        self.client_id: Optional[str] = None
+        self.subscriptions: Dict[str, int] = {}
+        self.next_packet_id = 0
+
+
+class SimpleMQTTBroker(QObject):
+    # A stand-in broker for MQTTPlugin: MQTT 3.1.1 with QoS 0 and 1, retained
+    # messages and wildcard subscriptions, but no persistent sessions or
+    # authentication. Acknowledgements from clients aren't tracked.
+    def __init__(self, parent=None, **kwargs):
+        super().__init__(parent, **kwargs)
+
+        self._server: Optional[QTcpServer] = None
+        self._sessions: Dict[QTcpSocket, Session] = {}
+        self._retained: Dict[str, bytes] = {}
+
+        self._packet_counts: Dict[str, int] = {}
+        self._client_ids: Set[str] = set()
+
+    def start_server(self, ip_address: str, port: int):
+        self._server = QTcpServer(
+            self, newConnection=self.new_connection
+        )  # type:ignore
+        self._server.listen(QHostAddress(ip_address), port)
+        if not self._server.isListening():
+            raise Exception(f"Not able to listen on {ip_address}:{port}")
+        logger.debug(f"Started SimpleMQTTBroker listening on {ip_address}:{port}")
+
+    @pyqtSlot()
+    def new_connection(self):
+        while self._server.hasPendingConnections():
+            socket: QTcpSocket = self._server.nextPendingConnection()
+            socket.readyRead.connect(self.read_data)
+            socket.disconnected.connect(self.remove_socket)
+            self._sessions[socket] = Session()
+
+    @pyqtSlot()
+    def remove_socket(self):
+        socket: QTcpSocket = self.sender()
+        self._sessions.pop(socket, None)
+        socket.deleteLater()
+
+    @pyqtSlot()
+    def read_data(self):
+        socket: QTcpSocket = self.sender()
+        session = self._sessions.get(socket)
+        if session is None:
+            return
+        session.buffer += socket.readAll().data()
+        try:
+            while True:
+                packet = decode_packet(session.buffer)
+                if packet is None:
+                    break
+                self.handle_packet(socket, session, *packet)
+        except (ValueError, IndexError, struct.error, UnicodeDecodeError) as exc:
+            logger.warning(f"Invalid packet from {session.client_id}: {exc}")
+            socket.abort()
+
+    def handle_packet(
+        self, socket: QTcpSocket, session: Session, packet_type: int, flags: int, body
+    ):  # pylint:disable=too-many-arguments
+        if packet_type == CONNECT:
+            self.count("CONNECT")
+            (name_length,) = struct.unpack_from("!H", body)
+            index = 2 + name_length + 4  # Protocol level, flags and keep alive
+            (id_length,) = struct.unpack_from("!H", body, index)
+            client_id = body[index + 2 : index + 2 + id_length].decode("utf8")
+            session.client_id = client_id
+            self._client_ids.add(client_id)
+            logger.debug(f"Client {client_id} connected")
+            socket.write(encode_packet(CONNACK, 0, bytes([0, 0])))
+        elif session.client_id is None:
+            socket.abort()
+        elif packet_type == SUBSCRIBE:
+            self.count("SUBSCRIBE")
+            packet_id = body[:2]
+            index, granted, topic_filters = 2, bytearray(), []
+            while index < len(body):
+                (length,) = struct.unpack_from("!H", body, index)
+                topic_filter = body[index + 2 : index + 2 + length].decode("utf8")
+                qos = min(body[index + 2 + length], 1)
+                index += 3 + length
+                session.subscriptions[topic_filter] = qos
+                granted.append(qos)
+                topic_filters.append(topic_filter)
+            socket.write(encode_packet(SUBACK, 0, packet_id + bytes(granted)))
+            for topic_filter in topic_filters:
+                self.send_retained(socket, session, topic_filter)
+        elif packet_type == PUBLISH:
+            self.count("PUBLISH")
+            topic, payload, qos, packet_id = decode_publish(flags, body)
+            if qos:
+                socket.write(encode_packet(PUBACK, 0, struct.pack("!H", packet_id)))
+            if flags & 0x01:
+                if payload:
+                    self._retained[topic] = payload
+                else:
+                    self._retained.pop(topic, None)
+            self.route(topic, payload, qos)
+        elif packet_type == PINGREQ:
+            self.count("PINGREQ")
+            socket.write(encode_packet(PINGRESP, 0))
+        elif packet_type == DISCONNECT:
+            socket.disconnectFromHost()
+        elif packet_type != PUBACK:
+            logger.warning(f"Unsupported packet type {packet_type}, closing")
+            socket.abort()
+
+    def send_retained(self, socket: QTcpSocket, session: Session, topic_filter: str):
+        for topic, payload in self._retained.items():
+            if topic_matches(topic_filter, topic):
+                self.send(socket, session, topic, payload, 0, True)
+
+    def route(self, topic: str, payload: bytes, qos: int):
+        for socket, session in self._sessions.items():
+            granted = [
+                granted_qos
+                for topic_filter, granted_qos in session.subscriptions.items()
+                if topic_matches(topic_filter, topic)
+            ]
+            if granted:
+                self.send(socket, session, topic, payload, min(qos, max(granted)))
+
+    def send(
+        self,
+        socket: QTcpSocket,
+        session: Session,
+        topic: str,
+        payload: bytes,
+        qos: int,
+        retain: bool = False,
+    ):  # pylint:disable=too-many-arguments
+        packet_id = 0
+        if qos:
+            session.next_packet_id = session.next_packet_id % 0xFFFF + 1
+            packet_id = session.next_packet_id
+        socket.write(encode_publish(topic, payload, qos, retain, packet_id))
+
+    def count(self, packet_name: str):
+        self._packet_counts[packet_name] = self._packet_counts.get(packet_name, 0) + 1
+
+    def summary(self) -> str:
+        lines: List[str] = [f"Clients: {len(self._client_ids)}"]
+        lines.extend(
+            f"  {packet_name}: {count}"
+            for packet_name, count in sorted(self._packet_counts.items())
+        )
+        lines.append(f"Retained topics: {len(self._retained)}")
+        return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="SimpleMQTTBroker")
+    parser.add_argument("-H", "--host", required=True)
+    parser.add_argument("-p", "--port", type=int, default=1883)
+    parser.add_argument(
+        "-v",
+        "--verbose",
+        help="Increase verbosity (may increase up to -vvv)",
+        action="count",
+        default=0,
+    )
+    args = parser.parse_args()
+
+    # 40-10*0=40==logging.ERROR
+    verbosity = max(40 - 10 * args.verbose, 10)
+    logger.setLevel(verbosity)
+
+    a = QApplication(sys.argv)
+    s = SimpleMQTTBroker()
+    s.start_server(args.host, args.port)
+
+    signal.signal(signal.SIGINT, lambda *_: a.quit())
+    signal.signal(signal.SIGTERM, lambda *_: a.quit())
+    # Gives the interpreter a chance to run the signal handlers
+    signal_timer = QTimer(timeout=lambda: None)  # type:ignore
+    signal_timer.start(200)
+
+    exit_code = a.exec()
+    print(s.summary())
+    sys.exit(exit_code)
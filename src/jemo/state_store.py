@@ -0,0 +1,158 @@
+import glob
+import os
+import time
+from typing import Dict, Optional, Set, TextIO, Tuple
+
+from PyQt6.QtCore import QObject, QTimer, pyqtSlot
+
+from . import logger
+
+StateEntry = Tuple[str, float]
+
+
+class StateJournal(QObject):  # pylint:disable=too-many-instance-attributes
+    # Append-only journal of "<serial> <action> <timestamp>" lines. Records are
+    # batched and written behind on a timer so that recording a state change
+    # never blocks the response to the request that caused it. The journal is
+    # rewritten with only the latest entry per device once it has grown to
+    # compact_ratio times the number of devices it holds.
+    def __init__(
+        self,
+        path: str,
+        *,
+        flush_interval: int = 1000,
+        compact_ratio: int = 8,
+        parent=None,
+        **kwargs,
+    ) -> None:
+        super().__init__(parent, **kwargs)
+        self._path = path
+        self._compact_ratio = compact_ratio
+        self._pending: Dict[str, StateEntry] = {}
+        self._file: Optional[TextIO] = None
+        # Devices in this journal's own file, as opposed to the merged view of
+        # every worker's journal used by get()
+        self._serials: Set[str] = set()
+
+        self._states = self.load()
+        self._lines = self._count_lines()
+        logger.debug(f"Loaded {len(self._states)} device states from {path}")
+
+        self._flush_timer = QTimer(
+            self, singleShot=True, timeout=self.flush
+        )  # type:ignore
+        self._flush_interval = flush_interval
+
+    @property
+    def path(self) -> str:
+        return self._path
+
+    @staticmethod
+    def worker_path(path: str, index: int) -> str:
+        base_path, extension = os.path.splitext(path)
+        return f"{base_path}.worker{index}{extension}"
+
+    def _count_lines(self) -> int:
+        if not os.path.exists(self._path):
+            return 0
+        with open(self._path, "rb") as journal:
+            return sum(1 for _ in journal)
+
+    def load(self) -> Dict[str, StateEntry]:
+        # Worker processes each write their own journal, see worker_path, so
+        # the newest entry across all of them wins
+        base_path, extension = os.path.splitext(self._path)
+        if ".worker" in os.path.basename(base_path):
+            base_path = base_path.rsplit(".worker", 1)[0]
+        paths = {
+            f"{base_path}{extension}",
+            self._path,
+            *glob.glob(f"{glob.escape(base_path)}.worker*{glob.escape(extension)}"),
+        }
+
+        states: Dict[str, StateEntry] = {}
+        for path in paths:
+            try:
+                with open(path, "r", encoding="utf8") as journal:
+                    for line in journal:
+                        parts = line.split()
+                        # Skip lines torn by a crash mid-write
+                        if len(parts) != 3 or not line.endswith("\n"):
+                            continue
+                        serial, action, timestamp = parts
+                        try:
+                            entry = (action, float(timestamp))
+                        except ValueError:
+                            continue
+                        if serial not in states or states[serial][1] <= entry[1]:
+                            states[serial] = entry
+                        if path == self._path:
+                            self._serials.add(serial)
+            except FileNotFoundError:
+                continue
+        return states
+
+    def get(self, serial: str) -> Optional[StateEntry]:
+        return self._pending.get(serial, self._states.get(serial))
+
+    def record(self, serial: str, action: str, timestamp: Optional[float] = None):
+        self._pending[serial] = (
+            action,
+            time.time() if timestamp is None else timestamp,
+        )
+        if not self._flush_timer.isActive():
+            self._flush_timer.start(self._flush_interval)
+
+    @pyqtSlot()
+    def flush(self):
+        if not self._pending:
+            return
+
+        pending, self._pending = self._pending, {}
+        self._states.update(pending)
+        self._serials.update(pending)
+        try:
+            if self._lines + len(pending) > self._compact_ratio * max(
+                len(self._serials), 16
+            ):
+                self.compact()
+                return
+
+            if self._file is None:
+                self._file = open(  # pylint:disable=consider-using-with
+                    self._path, "a", encoding="utf8"
+                )
+            self._file.writelines(
+                f"{serial} {action} {timestamp:.3f}\n"
+                for serial, (action, timestamp) in pending.items()
+            )
+            self._file.flush()
+            self._lines += len(pending)
+        except OSError as exc:
+            logger.error(f"Unable to write state journal {self._path}: {exc}")
+
+    def compact(self):
+        logger.debug(f"Compacting state journal {self._path}")
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+        compact_path = f"{self._path}.compact"
+        with open(compact_path, "w", encoding="utf8") as journal:
+            journal.writelines(
+                f"{serial} {action} {timestamp:.3f}\n"
+                for serial, (action, timestamp) in self._states.items()
+                if serial in self._serials
+            )
+            journal.flush()
+            os.fsync(journal.fileno())
+        os.replace(compact_path, self._path)
+        self._lines = len(self._serials)
+
+    @pyqtSlot()
+    def close(self):
+        self._flush_timer.stop()
+        self.flush()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
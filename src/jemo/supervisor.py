@@ -0,0 +1,224 @@
+import multiprocessing
+import os
+import queue
+import signal
+import sys
+import time
+from typing import Iterator, List, Mapping, Optional, Tuple
+
+from PyQt6.QtCore import QObject, QTimer, pyqtSlot
+from PyQt6.QtWidgets import QApplication
+
+from . import logger
+from .config import DeviceConfig
+from .device import setup_devices
+from .device_table import DeviceTable
+from .diagnostics import setup_diagnostics
+
+HEARTBEAT_INTERVAL = 5
+MIN_RESTART_DELAY = 1
+MAX_RESTART_DELAY = 60
+
+
+def run_worker(
+    index: int,
+    device_configs: List[DeviceConfig],
+    ip_addresses: List[str],
+    jemo_config: Mapping,
+    health_queue: "multiprocessing.Queue",
+    log_level: int,
+):  # pylint:disable=too-many-arguments
+    logger.setLevel(log_level)
+    application = QApplication(sys.argv)
+
+    def signal_handler(_, __):
+        logger.debug(f"Worker {index} attempting clean exit...")
+        application.quit()
+
+    signal.signal(signal.SIGINT, signal_handler)
+    signal.signal(signal.SIGTERM, signal_handler)
+
+    diagnostics = setup_diagnostics(application, jemo_config.get("diagnostics"))
+    jemo_devices = setup_devices(
+        application,
+        device_configs,
+        ip_addresses,
+        jemo_config,
+        # Only this worker's devices; the parent's SSDPServer answers for all
+        DeviceTable(),
+        worker_index=index,
+        diagnostics=diagnostics,
+    )
+    logger.info(f"Worker {index} ({os.getpid()}) serving {len(jemo_devices)} devices")
+
+    def heartbeat():
+        health_queue.put((index, os.getpid(), time.time(), len(jemo_devices)))
+
+    heartbeat()
+    heartbeat_timer = QTimer(timeout=heartbeat)  # type:ignore
+    heartbeat_timer.start(HEARTBEAT_INTERVAL * 1000)
+
+    sys.exit(application.exec())
+
+
+class Worker:  # pylint:disable=too-many-instance-attributes
+    def __init__(self, index: int, device_configs: List[DeviceConfig]) -> None:
+        self.index = index
+        self.device_configs = device_configs
+        self.process: Optional[multiprocessing.process.BaseProcess] = None
+        self.started_at = 0.0
+        self.last_heartbeat = 0.0
+        self.restarts = 0
+        self.restart_delay = MIN_RESTART_DELAY
+        self.restart_at: Optional[float] = None
+
+    @property
+    def pid(self) -> Optional[int]:
+        return self.process.pid if self.process else None
+
+    def is_alive(self) -> bool:
+        return self.process is not None and self.process.is_alive()
+
+
+class Supervisor(QObject):  # pylint:disable=too-many-instance-attributes
+    def __init__(
+        self,
+        device_configs: List[DeviceConfig],
+        ip_addresses: List[str],
+        *,
+        jemo_config: Mapping,
+        workers: int,
+        health_report_interval: int = 60,
+        parent=None,
+        **kwargs,
+    ):  # pylint:disable=too-many-arguments
+        super().__init__(parent, **kwargs)
+
+        self._ip_addresses = ip_addresses
+        # Plugins are handed to workers as device_configs
+        self._jemo_config = {k: v for k, v in jemo_config.items() if k != "plugins"}
+        self._health_report_interval = health_report_interval
+        self._context = multiprocessing.get_context("spawn")
+        self._health_queue = self._context.Queue()
+        self._stopping = False
+
+        # Round-robin so that devices of each plugin are spread across workers
+        workers = max(1, min(workers, len(device_configs)))
+        self._workers = [
+            Worker(index, device_configs[index::workers]) for index in range(workers)
+        ]
+
+        self._check_timer = QTimer(self, timeout=self.check_workers)  # type:ignore
+        self._report_timer = QTimer(self, timeout=self.report_health)  # type:ignore
+
+    def devices(self) -> Iterator[Tuple[str, int]]:
+        for worker in self._workers:
+            for _, plugin_vars, device in worker.device_configs:
+                device_vars = {**plugin_vars, **device}
+                yield device_vars["name"], device_vars["port"]
+
+    def start(self):
+        for worker in self._workers:
+            self.start_worker(worker)
+        self._check_timer.start(1000)
+        if self._health_report_interval > 0:
+            self._report_timer.start(self._health_report_interval * 1000)
+
+    def start_worker(self, worker: Worker):
+        worker.process = self._context.Process(
+            target=run_worker,
+            args=(
+                worker.index,
+                worker.device_configs,
+                self._ip_addresses,
+                self._jemo_config,
+                self._health_queue,
+                logger.level,
+            ),
+            name=f"jemo-worker-{worker.index}",
+            daemon=True,
+        )
+        worker.process.start()
+        worker.started_at = worker.last_heartbeat = time.time()
+        worker.restart_at = None
+        logger.info(
+            f"Started worker {worker.index} ({worker.pid}) "
+            f"with {len(worker.device_configs)} devices"
+        )
+
+    @pyqtSlot()
+    def check_workers(self):
+        while True:
+            try:
+                index, pid, timestamp, _ = self._health_queue.get_nowait()
+            except queue.Empty:
+                break
+            worker = self._workers[index]
+            if worker.pid == pid:
+                worker.last_heartbeat = timestamp
+
+        if self._stopping:
+            return
+
+        now = time.time()
+        for worker in self._workers:
+            if worker.restart_at is not None:
+                if now >= worker.restart_at:
+                    worker.restarts += 1
+                    self.start_worker(worker)
+                continue
+
+            if worker.is_alive():
+                if now - worker.last_heartbeat > 3 * HEARTBEAT_INTERVAL:
+                    logger.error(
+                        f"Worker {worker.index} ({worker.pid}) is unresponsive, "
+                        "terminating"
+                    )
+                    worker.process.kill()  # type:ignore
+                continue
+
+            exitcode = worker.process.exitcode if worker.process else None
+            # Back off if the worker keeps crashing straight after starting
+            if now - worker.started_at < MAX_RESTART_DELAY:
+                worker.restart_delay = min(worker.restart_delay * 2, MAX_RESTART_DELAY)
+            else:
+                worker.restart_delay = MIN_RESTART_DELAY
+            worker.restart_at = now + worker.restart_delay
+            logger.error(
+                f"Worker {worker.index} ({worker.pid}) exited with code {exitcode}, "
+                f"restarting in {worker.restart_delay}s"
+            )
+
+    def health(self) -> List[dict]:
+        now = time.time()
+        return [
+            {
+                "worker": worker.index,
+                "pid": worker.pid,
+                "alive": worker.is_alive(),
+                "devices": len(worker.device_configs),
+                "restarts": worker.restarts,
+                "uptime": round(now - worker.started_at, 1),
+                "heartbeat_age": round(now - worker.last_heartbeat, 1),
+            }
+            for worker in self._workers
+        ]
+
+    @pyqtSlot()
+    def report_health(self):
+        for worker_health in self.health():
+            logger.info(f"Worker health: {worker_health}")
+
+    @pyqtSlot()
+    def stop(self):
+        self._stopping = True
+        self._check_timer.stop()
+        self._report_timer.stop()
+        for worker in self._workers:
+            if worker.is_alive():
+                worker.process.terminate()  # type:ignore
+        for worker in self._workers:
+            if worker.process is not None:
+                worker.process.join(5)
+                if worker.process.is_alive():
+                    worker.process.kill()
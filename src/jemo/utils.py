@@ -1,33 +1,98 @@
 import uuid
-from typing import Optional
+from typing import Dict, List, NamedTuple, Optional, Sequence
 
-from PyQt6.QtNetwork import QHostInfo, QUdpSocket
+from PyQt6.QtNetwork import QAbstractSocket, QHostAddress, QNetworkInterface
 
 from . import logger
 
 
-def get_local_ip(ip_address: Optional[str] = None) -> str:
-    if not ip_address or ip_address.lower() == "auto":
-        logger.debug("Attempting to get IP address automatically")
+class LocalAddress(NamedTuple):
+    interface: str
+    interface_index: int
+    ip_address: str
+    prefix_length: int
+
+    def contains(self, address: QHostAddress) -> bool:
+        return address.isInSubnet(QHostAddress(self.ip_address), self.prefix_length)
+
+
+def _matches(interface: str, address: QHostAddress, selector: str) -> bool:
+    if selector == interface:
+        return True
+    subnet, prefix_length = QHostAddress.parseSubnet(selector)
+    return prefix_length >= 0 and address.isInSubnet(subnet, prefix_length)
+
+
+def get_local_addresses(
+    selectors: Optional[Sequence[str]] = None,
+) -> List[LocalAddress]:
+    # Selectors are interface names (e.g. eth0) or subnets (e.g. 192.168.1.0/24)
+    addresses: List[LocalAddress] = []
+    flags = QNetworkInterface.InterfaceFlag
+    for interface in QNetworkInterface.allInterfaces():
+        interface_flags = interface.flags()
+        if not interface_flags & flags.IsUp or not interface_flags & flags.IsRunning:
+            continue
+        # Loopback is only used if explicitly selected
+        if interface_flags & flags.IsLoopBack and not selectors:
+            continue
 
-        logger.debug(f"Host name: {QHostInfo.localHostName()}")
-        host_name = QHostInfo.localHostName()
-        host_info = QHostInfo.fromName(host_name)
-        host_address = host_info.addresses()[0].toString()
+        for entry in interface.addressEntries():
+            address = entry.ip()
+            if address.protocol() != QAbstractSocket.NetworkLayerProtocol.IPv4Protocol:
+                continue
+            if selectors and not any(
+                _matches(interface.name(), address, selector) for selector in selectors
+            ):
+                continue
+            addresses.append(
+                LocalAddress(
+                    interface.name(),
+                    interface.index(),
+                    address.toString(),
+                    entry.prefixLength(),
+                )
+            )
+    return addresses
 
-        if host_address in ("127.0.1.1", "127.0.0.1", "localhost", "unknown"):
-            logger.debug("(Damn you linux!)")
 
-            udp_socket = QUdpSocket()
-            udp_socket.connectToHost("8.8.8.8", 80)
-            if not udp_socket.waitForConnected():
-                raise Exception("Unable to determine IP address!")
-            host_address = udp_socket.localAddress().toString()
+def find_local_address(ip_address: str) -> LocalAddress:
+    address = QHostAddress(ip_address)
+    for interface in QNetworkInterface.allInterfaces():
+        for entry in interface.addressEntries():
+            if entry.ip().isEqual(address):
+                return LocalAddress(
+                    interface.name(),
+                    interface.index(),
+                    ip_address,
+                    entry.prefixLength(),
+                )
+    return LocalAddress("", 0, ip_address, 0)
 
-        logger.debug(f"Using IP address: {host_address}")
-        return host_address
-    return ip_address
+
+def resolve_local_addresses(
+    ip_address: Optional[str] = None, interfaces: Optional[Sequence[str]] = None
+) -> List[LocalAddress]:
+    if not ip_address or ip_address.lower() == "auto":
+        logger.debug("Attempting to get IP addresses automatically")
+
+        addresses = get_local_addresses(interfaces)
+        if not addresses:
+            raise Exception("Unable to determine IP address!")
+
+        logger.debug(f"Using IP addresses: {addresses}")
+        return addresses
+    return [find_local_address(ip_address)]
 
 
 def make_serial(name: str) -> str:
     return str(uuid.uuid3(uuid.NAMESPACE_X500, name))
+
+
+def parse_http_headers(msg: str) -> Dict[str, str]:
+    headers: Dict[str, str] = {}
+    for line in msg.split("\r\n\r\n", 1)[0].splitlines()[1:]:
+        key, sep, value = line.partition(":")
+        if sep:
+            headers[key.strip().upper()] = value.strip()
+    return headers